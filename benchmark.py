@@ -0,0 +1,392 @@
+# benchmark.py
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+from PIL import Image
+
+# Offline benchmark of the ingest and read paths:
+#
+#   python benchmark.py --files 2000 --out runs/2024-05-01.json
+#   python benchmark.py --files 2000 --compare runs/2024-05-01.json
+#   python benchmark.py --startup-only      # web worker import budget, exit 1 if over
+#
+# A synthetic corpus (JPEGs with controllable EXIF in nested folders) is
+# written once per parameter set and reused. Every stage runs against the
+# SQLite backend in a scratch directory, so no MySQL server is needed.
+# Output is JSON with sorted keys; timings are the median of --repeat runs.
+
+BENCHMARK_VERSION = 1
+
+_MAKES = [("Apple", "iPhone 12"), ("Canon", "EOS 80D"), ("SONY", "ILCE-7M3"), ("NIKON", "D750")]
+_TAGS = ["sunrise", "mountains", "sky", "beach", "family", "city", "night", "snow", "dog", "forest"]
+
+# EXIF IFD0 tag ids
+_MAKE, _MODEL, _DATETIME, _XPKEYWORDS = 0x010F, 0x0110, 0x0132, 0x9C9E
+
+
+# -----------------------------
+# Synthetic corpus
+# -----------------------------
+def corpus_params(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "files": args.files,
+        "depth": args.depth,
+        "fanout": args.fanout,
+        "exif_ratio": args.exif_ratio,
+        "tags_per_image": args.tags_per_image,
+        "image_size": args.image_size,
+        "seed": args.seed,
+    }
+
+
+def make_corpus(root: Path, params: Dict[str, Any]) -> int:
+    """
+    Write params["files"] JPEGs under root, spread over a directory tree
+    params["depth"] levels deep with params["fanout"] folders per level.
+
+    The same params always give the same files. A corpus.json stamp
+    lets a later run reuse the tree instead of rewriting it.
+
+    Returns:
+      number of files written (0 if reused)
+    """
+    stamp = root / "corpus.json"
+    if stamp.exists() and json.loads(stamp.read_text()) == params:
+        return 0
+
+    rng = random.Random(params["seed"])
+    dirs = [Path()]
+    for _ in range(params["depth"]):
+        dirs = [d / f"d{i:02d}" for d in dirs for i in range(params["fanout"])]
+
+    w, h = params["image_size"]
+    start = datetime(2015, 1, 1)
+    for n in range(params["files"]):
+        target = root / dirs[n % len(dirs)] / f"IMG_{n:06d}.jpg"
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        exif = Image.Exif()
+        if rng.random() < params["exif_ratio"]:
+            make, model = rng.choice(_MAKES)
+            taken = start + timedelta(seconds=rng.randrange(10 * 365 * 24 * 3600))
+            exif[_MAKE] = make
+            exif[_MODEL] = model
+            exif[_DATETIME] = taken.strftime("%Y:%m:%d %H:%M:%S")
+            if params["tags_per_image"]:
+                tags = rng.sample(_TAGS, min(params["tags_per_image"], len(_TAGS)))
+                exif[_XPKEYWORDS] = (";".join(tags) + "\0").encode("utf-16le")
+
+        Image.new("RGB", (w, h), color).save(target, "JPEG", quality=85, exif=exif.tobytes())
+
+    stamp.write_text(json.dumps(params))
+    return params["files"]
+
+
+def write_config(workdir: Path, corpus: Path, workers: int) -> Path:
+    """config.yaml for the run: SQLite, no result cache, no thumbnail pregeneration."""
+    data = {
+        "app": {"name": "benchmark", "upload_folder": str(corpus.resolve()), "page_size": 100},
+        "database": {"type": "sqlite", "path": str(workdir / "bench.db"), "table": "image_info"},
+        "cache": {"enabled": False},
+        "images": {"allowed_extensions": ["jpg", "jpeg"]},
+        "ingest": {"workers": workers},
+        "manifest": {"file": str(workdir / "manifest.json")},
+        "thumbnails": {"dir": str(workdir / "thumbs"), "pregenerate": False},
+    }
+    path = workdir / "config.yaml"
+    path.write_text(yaml.safe_dump(data, sort_keys=True))
+    return path
+
+
+# -----------------------------
+# Timing
+# -----------------------------
+def timed(fn: Callable[[], Any], repeat: int, setup: Callable[[], None] | None = None) -> Tuple[List[float], Any]:
+    """Run fn() repeat times (setup() before each, untimed). Returns (seconds per run, last result)."""
+    times: List[float] = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        # the code under test prints progress; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def stage_result(times: List[float], items: int) -> Dict[str, Any]:
+    median = statistics.median(times)
+    return {
+        "items": items,
+        "runs": len(times),
+        "median_s": round(median, 6),
+        "min_s": round(min(times), 6),
+        "max_s": round(max(times), 6),
+        "per_item_ms": round(median * 1000 / items, 4) if items else None,
+        "items_per_s": round(items / median, 1) if median > 0 else None,
+    }
+
+
+# -----------------------------
+# Stages
+# -----------------------------
+def run_stages(workdir: Path, corpus: Path, repeat: int, search_rounds: int) -> Dict[str, Any]:
+    # imported here: web.py reads ./config.yaml at import time
+    from config import Config
+    from database import ImageDBService, next_cursor
+    from filereader import ExifDataFrameBuilder
+    from reader import FileReader
+
+    cfg = Config(str(workdir / "config.yaml"))
+    stages: Dict[str, Any] = {}
+
+    # --- directory walk ---
+    reader = FileReader(cfg)
+    times, files = timed(lambda: reader.read_images(corpus), repeat)
+    stages["walk"] = stage_result(times, len(files))
+
+    # --- EXIF extraction ---
+    builder = ExifDataFrameBuilder(cfg)
+    times, df = timed(lambda: builder.build_dataframe(corpus), repeat)
+    stages["extract"] = stage_result(times, len(df))
+
+    # --- DB insert, into an empty database every run ---
+    db_path = Path(cfg.DB_PATH)
+    holder: Dict[str, ImageDBService] = {}
+
+    def fresh_db() -> None:
+        if "db" in holder:
+            holder["db"].backend.close()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        holder["db"] = ImageDBService(cfg)
+        holder["db"]._connect().close()   # schema creation is not part of the insert
+
+    times, inserted = timed(lambda: holder["db"].insert_dataframe(df), repeat, setup=fresh_db)
+    stages["insert"] = stage_result(times, inserted)
+    db = holder["db"]
+
+    # --- search: a fixed mix of the gallery's query shapes ---
+    rows = db.get_all_images(limit=len(df) or 1)
+    dated = sorted(r["exif_datetime"] for r in rows if r["exif_datetime"])
+    mid = dated[len(dated) // 2].date() if dated else datetime(2020, 1, 1).date()
+    filename = rows[len(rows) // 2]["image_filename"] if rows else "IMG_000000.jpg"
+    queries: List[Callable[[], Any]] = [
+        lambda: db.search(exif_datetime=mid),
+        lambda: db.search(date_from=mid - timedelta(days=180), date_to=mid + timedelta(days=180), limit=100),
+        lambda: db.search(image_filename=filename),
+        lambda: db.search(tags=["sky"], limit=100),
+        lambda: db.search(tags=["sky", "beach"], tag_mode="any", limit=100),
+        lambda: db.get_all_images(limit=100),
+    ]
+
+    def search_mix() -> int:
+        for _ in range(search_rounds):
+            for q in queries:
+                q()
+        return search_rounds * len(queries)
+
+    times, n = timed(search_mix, repeat)
+    stages["search"] = stage_result(times, n)
+
+    # --- gallery render through the Flask test client ---
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import web
+        client = web.web.test_client()
+
+        def render_pages() -> int:
+            pages = 0
+            resp = client.get("/gallery")
+            assert resp.status_code == 200, resp.status_code
+            pages += 1
+            first = db.get_all_images(limit=cfg.PAGE_SIZE)
+            cursor = next_cursor(first, cfg.PAGE_SIZE)
+            # follow infinite scroll for a few pages
+            while cursor and pages < 5:
+                resp = client.get("/api/images", query_string={"cursor": cursor})
+                assert resp.status_code == 200, resp.status_code
+                cursor = resp.get_json()["next_cursor"]
+                pages += 1
+            return pages
+
+        times, pages = timed(render_pages, repeat)
+        stages["gallery"] = stage_result(times, pages)
+    finally:
+        os.chdir(cwd)
+
+    db.backend.close()
+    return stages
+
+
+# -----------------------------
+# Web worker startup budget
+# -----------------------------
+# Every Flask/WSGI worker imports web.py. The ingest stack (pandas,
+# Pillow, the MySQL driver) must stay out of that import; these modules
+# showing up after `import web` is a budget violation by itself.
+STARTUP_FORBIDDEN = ("pandas", "numpy", "PIL", "mysql.connector", "filereader")
+
+_STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import web
+ms = (time.perf_counter() - t0) * 1000
+rss = None
+try:
+    # VmHWM: peak RSS of this process image (ru_maxrss survives exec from a big parent)
+    with open("/proc/self/status") as f:
+        rss = next(int(l.split()[1]) / 1024 for l in f if l.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        pass
+print(json.dumps({"import_ms": ms, "rss_mb": rss, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure_startup(workdir: Path, repeat: int) -> Dict[str, Any]:
+    """`import web` in repeat fresh interpreters: seconds per import, peak RSS, forbidden modules."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        p for p in (str(Path(__file__).resolve().parent), os.environ.get("PYTHONPATH")) if p))
+    times: List[float] = []
+    rss: List[float] = []
+    loaded: set = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _STARTUP_PROBE % (STARTUP_FORBIDDEN,)],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        times.append(probe["import_ms"] / 1000)
+        if probe["rss_mb"] is not None:
+            rss.append(probe["rss_mb"])
+        loaded.update(probe["loaded"])
+    return {
+        **stage_result(times, 1),
+        "rss_mb": round(max(rss), 1) if rss else None,
+        "heavy_modules": sorted(loaded),
+    }
+
+
+def startup_violations(startup: Dict[str, Any], max_import_ms: float, max_rss_mb: float) -> List[str]:
+    problems = []
+    if startup["median_s"] * 1000 > max_import_ms:
+        problems.append(f"import web took {startup['median_s'] * 1000:.0f} ms (budget {max_import_ms:.0f} ms)")
+    if startup["rss_mb"] is not None and startup["rss_mb"] > max_rss_mb:
+        problems.append(f"peak RSS after import web is {startup['rss_mb']} MB (budget {max_rss_mb:.0f} MB)")
+    if startup["heavy_modules"]:
+        problems.append("import web loads " + ", ".join(startup["heavy_modules"]))
+    return problems
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """Median-to-median table of two runs (>1.00x = slower than baseline)."""
+    lines = [f"{'stage':<10} {'baseline s':>12} {'current s':>12} {'ratio':>8}"]
+    for name, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            lines.append(f"{name:<10} {'-':>12} {now['median_s']:>12.4f} {'-':>8}")
+            continue
+        ratio = now["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        lines.append(f"{name:<10} {before['median_s']:>12.4f} {now['median_s']:>12.4f} {ratio:>7.2f}x")
+    if baseline.get("params") != current["params"]:
+        lines.append("note: corpus parameters differ from the baseline run")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark walk, extract, insert, search and gallery render.")
+    parser.add_argument("--files", type=int, default=1000, help="corpus size")
+    parser.add_argument("--depth", type=int, default=2, help="directory levels")
+    parser.add_argument("--fanout", type=int, default=4, help="sub folders per level")
+    parser.add_argument("--exif-ratio", type=float, default=0.9, help="share of files with EXIF")
+    parser.add_argument("--tags-per-image", type=int, default=3)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[64, 48], metavar=("W", "H"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (median is reported)")
+    parser.add_argument("--search-rounds", type=int, default=20, help="passes over the query mix per run")
+    parser.add_argument("--workers", type=int, default=1, help="ingest.workers for extraction")
+    parser.add_argument("--corpus", type=Path, help="corpus directory (kept and reused; default: temporary)")
+    parser.add_argument("--out", type=Path, help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", type=Path, help="earlier report to compare against")
+    parser.add_argument("--startup-only", action="store_true", help="only the web worker startup budget")
+    parser.add_argument("--max-import-ms", type=float, default=600, help="budget for `import web`")
+    parser.add_argument("--max-rss-mb", type=float, default=80, help="budget for peak RSS after `import web`")
+    args = parser.parse_args(argv)
+
+    params = corpus_params(args)
+    with tempfile.TemporaryDirectory(prefix="gallery-bench-") as tmp:
+        workdir = Path(tmp)
+        corpus = args.corpus or workdir / "corpus"
+        corpus.mkdir(parents=True, exist_ok=True)
+        write_config(workdir, corpus, args.workers)
+
+        stages: Dict[str, Any] = {}
+        if not args.startup_only:
+            t0 = time.perf_counter()
+            written = make_corpus(corpus, params)
+            print(f"corpus: {corpus} ({written} files written in {time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+            stages = run_stages(workdir, corpus, args.repeat, args.search_rounds)
+        # after run_stages: the probe opens the benchmark database too
+        stages["startup"] = measure_startup(workdir, args.repeat)
+
+    report = {
+        "benchmark": BENCHMARK_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "params": {**params, "repeat": args.repeat, "search_rounds": args.search_rounds, "workers": args.workers},
+        "stages": stages,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        print(compare(report, json.loads(args.compare.read_text())), file=sys.stderr)
+
+    problems = startup_violations(stages["startup"], args.max_import_ms, args.max_rss_mb)
+    for problem in problems:
+        print("STARTUP BUDGET:", problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,23 +14,86 @@ class Config:
         self.DEBUG = self._get("app.debug", False)
         self.UPLOAD_FOLDER = self._get("app.upload_folder", "uploads")
         self.MAX_CONTENT_LENGTH = self._get("app.max_content_length")
+        self.PAGE_SIZE = int(self._get("app.page_size", 100))
+        self.PAGE_SIZE_MAX = int(self._get("app.page_size_max", 500))
+        self.BATCH_TAG_LIMIT = int(self._get("app.batch_tag_limit", 5000))
 
         # ---- Server ----
         self.HOST = self._get("server.host", "127.0.0.1")
         self.PORT = self._get("server.port", 5000)
+        # hand /uploads file bodies to the front server via X-Sendfile
+        self.USE_X_SENDFILE = bool(self._get("server.use_x_sendfile", False))
 
         # ---- Database ----
-        self.DB_TYPE = self._get("database.type")
-        self.DB_PATH = self._get("database.path")
+        # type: mysql (server) or sqlite (embedded file at path)
+        self.DB_TYPE = self._get("database.type", "mysql")
+        self.DB_PATH = self._get("database.path", "data/app.db")
+
+        # ---- Query result cache ----
+        self.CACHE_ENABLED = bool(self._get("cache.enabled", True))
+        self.CACHE_TTL = float(self._get("cache.ttl_seconds", 30))
+        self.CACHE_MAX_ENTRIES = int(self._get("cache.max_entries", 1024))
 
         # ---- Images ----
         self.ALLOWED_EXTENSIONS = set(
             self._get("images.allowed_extensions", [])
         )
+        # ingested from the container header (videoheader.py), shown as <video>
+        self.VIDEO_EXTENSIONS = {
+            str(ext).lower().lstrip(".") for ext in self._get("images.video_extensions", [])
+        }
+
+        # ---- EXIF extraction ----
+        # profile: basic | camera | full, or a name under exif.profiles
+        self.EXIF_PROFILE = str(self._get("exif.profile", "basic"))
+        self.EXIF_PROFILES = self._get("exif.profiles", {}) or {}
+        # keep the tags beyond the image_info columns in image_exif (JSON + promoted columns)
+        self.EXIF_STORE = bool(self._get("exif.store", False))
 
         # ---- Metadata ----
         self.METADATA_FILE = self._get("metadata.file", "image_metadata.json")
 
+        # ---- Ingest ----
+        # workers: 1 = serial, 0 = one per CPU core
+        self.INGEST_WORKERS = int(self._get("ingest.workers", 1))
+        self.INGEST_CHUNK_SIZE = int(self._get("ingest.chunk_size", 32))
+        self.INGEST_BATCH_SIZE = int(self._get("ingest.batch_size", 500))
+        # content hash (move/rename detection): bytes read from each end, 0 = whole file
+        self.CONTENT_HASH_SAMPLE = int(self._get("ingest.content_hash_sample_kb", 64)) * 1024
+
+        # ---- Thumbnails ----
+        self.THUMB_DIR = self._get("thumbnails.dir", "data/thumbs")
+        self.THUMB_SIZES = self._get("thumbnails.sizes", {"small": 320, "large": 1280})
+        self.THUMB_GALLERY_SIZE = self._get("thumbnails.gallery_size", "small")
+        self.THUMB_FORMAT = str(self._get("thumbnails.format", "webp")).lower()
+        self.THUMB_QUALITY = int(self._get("thumbnails.quality", 80))
+        self.THUMB_MAX_CACHE_MB = int(self._get("thumbnails.max_cache_mb", 2048))
+        self.THUMB_PREGENERATE = bool(self._get("thumbnails.pregenerate", True))
+
+        # ---- Watcher ----
+        self.WATCH_DEBOUNCE = float(self._get("watcher.debounce_seconds", 2))
+        self.WATCH_MAX_DELAY = float(self._get("watcher.max_delay_seconds", 15))
+        self.WATCH_POLL_INTERVAL = float(self._get("watcher.poll_interval_seconds", 30))
+        self.WATCH_MANIFEST_SAVE = float(self._get("watcher.manifest_save_seconds", 60))
+        self.WATCH_WITH_WEB = bool(self._get("watcher.run_with_web", False))
+
+        # ---- Near-duplicates (phash.py) ----
+        self.PHASH_ENABLED = bool(self._get("duplicates.phash_on_ingest", True))
+        self.DUPLICATE_DISTANCE = int(self._get("duplicates.max_distance", 6))
+
+        # ---- Facets (facets.py) ----
+        self.FACETS_LIMIT = int(self._get("facets.limit", 12))
+        # full rebuild after this long, for writes from other processes (0 = never)
+        self.FACETS_MAX_AGE = float(self._get("facets.max_age_seconds", 300))
+
+        # ---- Metrics ----
+        self.METRICS_ENABLED = bool(self._get("metrics.enabled", True))
+        # statements slower than this are logged as warnings (0 = off)
+        self.SLOW_QUERY_MS = float(self._get("metrics.slow_query_ms", 200))
+
+        # ---- Manifest ----
+        self.MANIFEST_FILE = self._get("manifest.file", "data/manifest.json")
+
     # ---------------------
     # Internal helpers
     # ---------------------
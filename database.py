@@ -1,9 +1,179 @@
-import mysql.connector
-import pandas as pd
-from typing import Optional, List, Dict, Any, Tuple
-from datetime import datetime
+from __future__ import annotations
+
+import base64
+import json
+import sys
+import threading
+from contextlib import contextmanager
+
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple, Iterable, Iterator, Callable, Set
+from datetime import date, datetime, timedelta
+from pathlib import Path
 from config import Config
-from filereader import ExifDataFrameBuilder
+from metrics import TimedConnection, db_method, ingest_stage
+from migrations import migrate
+from querycache import QueryCache
+from storage import StorageBackend, open_backend
+from tagmanager import split_tags
+
+if TYPE_CHECKING:
+    # the web workers never import pandas; only the DataFrame ingest paths use it
+    import pandas as pd
+
+# image_info columns written by the ingest paths, in INSERT order
+IMAGE_COLUMNS = (
+    "image_filename",
+    "exif_datetime",
+    "full_path",
+    "created_time",
+    "exif_make",
+    "exif_model",
+    "exif_xpkeywords",
+    "phash",
+    "content_hash",
+)
+
+# build_dataframe() column -> image_info column
+FRAME_COLUMNS = {
+    "EXIF_DateTime": "exif_datetime",
+    "EXIF_Make": "exif_make",
+    "EXIF_Model": "exif_model",
+    "EXIF_XPKeywords": "exif_xpkeywords",
+}
+
+# columns of an export row (iter_search), in output order
+EXPORT_COLUMNS = (
+    "full_path",
+    "image_filename",
+    "exif_datetime",
+    "created_time",
+    "exif_make",
+    "exif_model",
+    "exif_xpkeywords",
+)
+
+# IMAGE_COLUMNS stored as DATETIME
+DATETIME_COLUMNS = ("exif_datetime", "created_time")
+
+# bulk_upsert() on an existing full_path: {new} is the incoming value.
+# NULLs never overwrite existing values and user-edited tags are kept.
+UPSERT_UPDATES = {
+    "image_filename": "{new}",
+    "created_time": "COALESCE({new}, created_time)",
+    "exif_datetime": "COALESCE({new}, exif_datetime)",
+    "exif_make": "COALESCE({new}, exif_make)",
+    "exif_model": "COALESCE({new}, exif_model)",
+    "exif_xpkeywords": "COALESCE(exif_xpkeywords, {new})",
+    "phash": "COALESCE({new}, phash)",
+    "content_hash": "COALESCE({new}, content_hash)",
+}
+
+# image_exif (exif.store): EXIF tag name -> typed, indexed column. All
+# other non-column tags are only in the JSON data column.
+EXIF_PROMOTED = {
+    "Orientation": ("orientation", int),
+    "ISOSpeedRatings": ("iso", int),
+    "FNumber": ("f_number", float),
+    "ExposureTime": ("exposure_time", float),
+    "FocalLength": ("focal_length", float),
+    "LensModel": ("lens_model", str),
+}
+EXIF_COLUMNS = ("image_id", "data") + tuple(col for col, _ in EXIF_PROMOTED.values())
+
+# per-file hash columns filled in after the fact (phash.py, fingerprint.py)
+HASH_COLUMNS = ("phash", "content_hash")
+
+# gallery order; (exif_datetime, full_path) is also the keyset cursor
+PAGE_ORDER = " ORDER BY exif_datetime DESC, full_path DESC"
+
+
+# ------------ KEYSET CURSORS ------------
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after row in PAGE_ORDER."""
+    dt = row.get("exif_datetime")
+    if isinstance(dt, datetime):
+        dt = dt.strftime("%Y-%m-%d %H:%M:%S")
+    elif dt is not None:
+        dt = str(dt)
+    raw = json.dumps([dt, row.get("full_path")]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Optional[str], str]:
+    """Inverse of encode_cursor(). Raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        dt, full_path = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid cursor: {token!r}") from e
+    if not isinstance(full_path, str):
+        raise ValueError(f"invalid cursor: {token!r}")
+    return dt, full_path
+
+
+def _path_dep(full_path: str) -> str:
+    """Cache dependency key of one image (MySQL compares paths case-insensitively)."""
+    return "path:" + str(full_path).lower()
+
+
+def _as_date(value: date | datetime | str) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _is_frame(rows: Any) -> bool:
+    pd = sys.modules.get("pandas")   # a DataFrame implies pandas is loaded
+    return pd is not None and isinstance(rows, pd.DataFrame)
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """
+    EXIF "2020:11:13 10:00:00", ISO strings, dates -> datetime.
+    Anything unparseable (e.g. "0000:00:00 00:00:00") -> None.
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    text = str(value).strip().strip("\x00").strip()
+    for fmt in ("%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def _exif_params(image_id: int, extra: Dict[str, Any]) -> Tuple[Any, ...]:
+    """image_exif row in EXIF_COLUMNS order."""
+    promoted = []
+    for name, (column, kind) in EXIF_PROMOTED.items():
+        value = extra.get(name)
+        if isinstance(value, list):
+            value = value[0] if value else None   # e.g. ISOSpeedRatings (100, 100)
+        try:
+            value = None if value is None else kind(value)
+        except (TypeError, ValueError):
+            value = None
+        if isinstance(value, str):
+            value = value.strip("\x00 ")[:128] or None
+        promoted.append(value)
+    data = json.dumps(extra, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+    return (image_id, data, *promoted)
+
+
+def next_cursor(rows: List[Dict[str, Any]], limit: int | None) -> Optional[str]:
+    """Cursor for the following page, or None when this was the last one."""
+    if not rows or limit is None or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1])
+
 
 class ImageDBService:
     def __init__(
@@ -11,25 +181,159 @@ class ImageDBService:
         config: Config | None = None,
     ):
         self.config = config or Config()
-        self.host = self.config._get("database.host", "localhost")
-        self.user = self.config._get("database.user", "root")
-        self.password = self.config._get("database.password", "1234")  
-        self.database = self.config._get("database.database", "image_gallery")
         self.table = self.config._get("database.table", "image_info")
 
+        # ---- storage backend (database.type: mysql | sqlite) ----
+        self.backend: StorageBackend = open_backend(self.config)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._local = threading.local()   # active session() connection per thread
+        self._write_listeners: List[Callable[[Set[str]], None]] = []
+
+        # ---- instrumentation (metrics.py) ----
+        self.metrics_enabled = self.config.METRICS_ENABLED
+        self.slow_query_ms = self.config.SLOW_QUERY_MS
+
+        # ---- result cache ----
+        self.cache: QueryCache | None = None
+        if self.config.CACHE_ENABLED:
+            self.cache = QueryCache(self.config.CACHE_MAX_ENTRIES, self.config.CACHE_TTL)
+
     # -------------------------
     # Internal: connection helper
     # -------------------------
     def _connect(self):
-        return mysql.connector.connect(
-            host=self.host,
-            user=self.user,
-            password=self.password,
-            database=self.database,
-        )
+        """
+        Borrow a connection from the backend (close() hands it back).
+        The first call also brings the schema up to date.
+        """
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self._ensure_schema()
+                    self._schema_ready = True
+        conn = self.backend.connect()
+        if self.metrics_enabled:
+            conn = TimedConnection(conn, self.slow_query_ms)
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[Any]:
+        """
+        Connection for a single method call.
+        Inside session() this is the session's connection and the
+        session owns the transaction; otherwise commit/rollback here.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._connect()
+        self._local.pending = set()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            self._flush_invalidations()
+
+    # -------------------------
+    # Sessions
+    # -------------------------
+    @contextmanager
+    def session(self) -> Iterator["ImageDBService"]:
+        """
+        Run several calls on one pooled connection and one transaction:
+
+            with db.session():
+                tags = db.get_tags(path)
+                db.update_tag_info(path, new_tags)
+
+        Commits on exit, rolls back on error. Nested sessions join the
+        outer one.
+        """
+        if getattr(self._local, "conn", None) is not None:
+            yield self
+            return
+
+        conn = self._connect()
+        self._local.conn = conn
+        self._local.pending = set()
+        try:
+            yield self
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            conn.close()
+            self._flush_invalidations()
     # -------------------------
-    # INSERT: DataFrame -> MySQL
+    # Result cache
     # -------------------------
+    def _cached(self, key: Tuple[Any, ...], load, deps: List[str]):
+        """
+        Serve key from the result cache or run load() and store it under
+        deps plus one "path:<full_path>" dependency per returned row.
+        Inside session() the cache is bypassed (reads must see the
+        session's own uncommitted writes).
+        """
+        if self.cache is None or getattr(self._local, "conn", None) is not None:
+            return load()
+
+        hit, value, token = self.cache.get(key)
+        if hit:
+            return list(value) if isinstance(value, list) else value
+
+        value = load()
+        row_deps = []
+        if isinstance(value, list):
+            row_deps = [_path_dep(r["full_path"]) for r in value if isinstance(r, dict) and r.get("full_path")]
+        self.cache.put(key, value, list(deps) + row_deps, token)
+        return list(value) if isinstance(value, list) else value
+
+    def _invalidate(self, *deps: str) -> None:
+        """
+        Drop cached results depending on deps. Called inside the write's
+        transaction; the same keys are dropped again once it commits, so
+        nothing read in between survives.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(*deps)
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.update(deps)
+
+    def _flush_invalidations(self) -> None:
+        pending = getattr(self._local, "pending", None)
+        self._local.pending = None
+        if not pending:
+            return
+        if self.cache is not None:
+            self.cache.invalidate(*pending)
+        for listener in self._write_listeners:
+            listener(pending)
+
+    def add_write_listener(self, listener: Callable[[Set[str]], None]) -> None:
+        """
+        listener(deps) runs after every write transaction with the
+        dependency keys it touched ("listing", "tags", "path:<full_path>"
+        ...). Used by in-memory indexes that derive from image_info.
+        """
+        self._write_listeners.append(listener)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats() if self.cache is not None else {}
+
+    # -------------------------
+    # INSERT: DataFrame -> database
+    # -------------------------
+    @db_method
     def insert_dataframe(self, df: pd.DataFrame) -> int:
         """
         Insert rows from DataFrame into MySQL.
@@ -43,186 +347,495 @@ class ImageDBService:
           - EXIF_Model
           - EXIF_XPKeywords
 
+        Thin wrapper around bulk_upsert(); rows whose full_path already
+        exists are updated instead of duplicated.
+
         Returns:
           number of rows inserted
         """
-        conn = self._connect()
-        try:
-            cursor = conn.cursor()
-            sql = f"""
-            INSERT INTO image_info
-            (image_filename, exif_datetime, full_path, created_time, exif_make, exif_model, exif_xpkeywords)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            df = df.where(pd.notnull(df), None)
-            data: List[Tuple[Any, ...]] = []
-            for _, row in df.iterrows():
-                data.append((
-                    row.get("image_filename"),
-                    row.get("EXIF_DateTime"),
-                    row.get("full_path"),
-                    row.get("created_time"),
-                    row.get("EXIF_Make"),
-                    row.get("EXIF_Model"),
-                    row.get("EXIF_XPKeywords"),
-                ))
-            if not data:
-                return 0
-            cursor.executemany(sql, data)
-            conn.commit()
-            return cursor.rowcount
-        finally:
-            conn.close()
+        return self.bulk_upsert(df)["inserted"]
 # ----------- CREATE NEW DATAFRAME ------------
+    @db_method
     def new_insert_dataframe(self,df : pd.DataFrame): 
-        conn = self._connect()
-        try:
-            cursor = conn.cursor()
+        return self.bulk_upsert(df)["inserted"]
+# ----------- INSERT RECORDS (streaming ingest) ------------
+    @db_method
+    def insert_records(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Insert a batch of records as yielded by
+        ExifDataFrameBuilder.iter_batches() (keys = IMAGE_COLUMNS).
 
-            sql = f"""
-            INSERT INTO image_info
-            (image_filename, exif_datetime, full_path, created_time, exif_make, exif_model, exif_xpkeywords)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            df = df.where(pd.notnull(df), None)
-            data: List[Tuple[Any, ...]] = []
-            for _, row in df.iterrows():
-                data.append((
-                    row.get("image_filename"),
-                    row.get("EXIF_DateTime"),
-                    row.get("full_path"),
-                    row.get("created_time"),
-                    row.get("EXIF_Make"),
-                    row.get("EXIF_Model"),
-                    row.get("EXIF_XPKeywords"),
-                ))
-
-            if not data:
-                return 0
-
-            cursor.executemany(sql, data)
-            conn.commit()
-            return cursor.rowcount
+        Returns:
+          number of rows inserted
+        """
+        return self.bulk_upsert(records)["inserted"]
+
+    @db_method
+    def ingest(self, batches: Iterable[List[Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        Drain a batch iterator into the table, one upsert per batch.
+        Only the current batch is ever in memory.
+        """
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+        for batch in batches:
+            with ingest_stage("upsert", len(batch)):
+                counts = self.bulk_upsert(batch)
+            for k, v in counts.items():
+                totals[k] += v
+        return totals
+# ----------- BULK UPSERT ------------
+    @db_method
+    def bulk_upsert(
+        self,
+        rows: pd.DataFrame | Iterable[Dict[str, Any]],
+        batch_size: int | None = None,
+    ) -> Dict[str, int]:
+        """
+        INSERT ... ON DUPLICATE KEY UPDATE keyed on full_path.
+
+        rows: a build_dataframe() DataFrame or records keyed by IMAGE_COLUMNS.
+        Each batch of batch_size rows is one multi-row statement and one
+        transaction (inside session() the session owns the transaction).
+
+        On conflict the file metadata is refreshed, but NULLs never
+        overwrite existing values and user-edited tags are kept.
+
+        Returns:
+          {"inserted": n, "updated": n, "unchanged": n}
+        """
+        extras: Dict[str, Dict[str, Any]] = {}
+        if not _is_frame(rows):
+            rows = list(rows)
+            extras = {r["full_path"]: r["exif_extra"] for r in rows if r.get("exif_extra")}
+
+        params = self._row_params(rows)
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        if not params:
+            return counts
+
+        batch_size = max(1, batch_size or self.config.INGEST_BATCH_SIZE)
+        path_idx = IMAGE_COLUMNS.index("full_path")
+
+        for i in range(0, len(params), batch_size):
+            # last occurrence of a path within the batch wins
+            batch = list({p[path_idx]: p for p in params[i:i + batch_size]}.values())
+            paths = [p[path_idx] for p in batch]
+
+            with self._connection() as conn:
+                cursor = conn.cursor()
+
+                marks = ", ".join(["%s"] * len(paths))
+                cursor.execute(f"SELECT COUNT(*) FROM {self.table} WHERE full_path IN ({marks})", paths)
+                existing = cursor.fetchone()[0]
+
+                sql = self.backend.upsert_sql(self.table, IMAGE_COLUMNS, "full_path", UPSERT_UPDATES, len(batch))
+                cursor.execute(sql, [v for p in batch for v in p])
+                affected = cursor.rowcount
+
+                # keep image_tags in step for rows that carry keywords
+                kw_idx = IMAGE_COLUMNS.index("exif_xpkeywords")
+                self._sync_tags(cursor, [p[path_idx] for p in batch if p[kw_idx]])
+                if extras:
+                    self._sync_exif(cursor, {p: extras[p] for p in paths if p in extras})
+
+                inserted = len(batch) - existing
+                updated = self.backend.updated_rows(affected, inserted)
+                counts["inserted"] += inserted
+                counts["updated"] += updated
+                counts["unchanged"] += existing - updated
+                self._invalidate("listing", *(_path_dep(p) for p in paths))
+
+        return counts
+
+    def _row_params(self, rows: pd.DataFrame | Iterable[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        """
+        Parameter tuples in IMAGE_COLUMNS order (no iterrows), with the
+        datetime columns parsed so every backend stores the same value.
+        """
+        if _is_frame(rows):
+            pd = sys.modules["pandas"]
+            frame = rows.rename(columns=FRAME_COLUMNS).reindex(columns=list(IMAGE_COLUMNS))
+            frame = frame.astype(object).where(pd.notnull(frame), None)
+            params = frame.itertuples(index=False, name=None)
+        else:
+            params = (tuple(r.get(c) for c in IMAGE_COLUMNS) for r in rows)
+
+        dt_idx = [IMAGE_COLUMNS.index(c) for c in DATETIME_COLUMNS]
+        out = []
+        for p in params:
+            p = list(p)
+            for i in dt_idx:
+                p[i] = _as_datetime(p[i])
+            out.append(tuple(p))
+        return out
 
+    def _sync_exif(self, cursor, extras: Dict[str, Dict[str, Any]]) -> None:
+        """Upsert the image_exif rows of these images. Runs on the caller's cursor/transaction."""
+        if not extras:
+            return
+        paths = list(extras)
+        marks = ", ".join(["%s"] * len(paths))
+        cursor.execute(f"SELECT id, full_path FROM {self.table} WHERE full_path IN ({marks})", paths)
+        rows = [_exif_params(image_id, extras[p]) for image_id, p in cursor.fetchall() if p in extras]
+        if not rows:
+            return
+        sql = self.backend.upsert_sql(
+            "image_exif", EXIF_COLUMNS, "image_id", {c: "{new}" for c in EXIF_COLUMNS[1:]}, len(rows)
+        )
+        cursor.execute(sql, [v for r in rows for v in r])
+
+    def _ensure_schema(self) -> None:
+        """
+        Apply pending migrations (migrations.py) once per service, on a
+        connection of its own because DDL commits implicitly (MySQL).
+        """
+        conn = self.backend.connect()
+        try:
+            migrate(self, conn)
         finally:
             conn.close()
+
+    def _sync_tags(self, cursor, full_paths: List[str]) -> None:
+        """
+        Rebuild the image_tags rows of these images from their
+        exif_xpkeywords. Runs on the caller's cursor/transaction.
+        """
+        if not full_paths:
+            return
+        marks = ", ".join(["%s"] * len(full_paths))
+        cursor.execute(
+            f"SELECT id, exif_xpkeywords FROM {self.table} WHERE full_path IN ({marks})",
+            list(full_paths),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        ids = [r[0] for r in rows]
+        cursor.execute(
+            f"DELETE FROM image_tags WHERE image_id IN ({', '.join(['%s'] * len(ids))})",
+            ids,
+        )
+        pairs = [(image_id, tag) for image_id, kw in rows for tag in split_tags(kw)]
+        if pairs:
+            # split_tags dedupes by casefold; MySQL's collation also folds
+            # accents ("cafe" = "café"), so the key may still collide
+            cursor.executemany(self.backend.insert_new_sql("image_tags", ("image_id", "tag")), pairs)
     # -------------------------
-    # SEARCH: MySQL -> rows
+    # SEARCH: database -> rows
     # -------------------------
+    @db_method
     def search(
         self,
         exif_datetime: Optional[datetime] = None,
         image_filename: Optional[str] = None,
         exif_xpkeywords: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tag_mode: str = "all",
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        exif_make: Optional[str] = None,
+        exif_model: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
         """
         Search image_info by:
-          - exif_datetime (exact match)
+          - exif_datetime (that calendar day)
+          - date_from / date_to (inclusive days, either end optional)
           - image_filename (exact match)
+          - exif_make / exif_model (exact match, e.g. from a facet)
+          - tags (exact match, from the image_tags index)
+
+        Dates are compared as half-open ranges on the raw column
+        (exif_datetime >= start AND exif_datetime < end) so the
+        exif_datetime index can be used.
 
-        Pass one or both. If both are None -> returns [].
+        exif_xpkeywords is a comma separated tag list and is merged into
+        tags. tag_mode "all" = image has every tag (AND), "any" = at
+        least one (OR).
+
+        Pass one or more. If all are None -> returns [].
+
+        Results are in PAGE_ORDER. With limit, pass next_cursor(rows, limit)
+        back as cursor to get the following page.
         """
-        if exif_datetime is None and image_filename is None and exif_xpkeywords is None:
+        wanted = split_tags(",".join((tags or []) + [exif_xpkeywords or ""]))
+        if exif_datetime is not None:
+            # a single day is just a one-day range
+            date_from = date_to = _as_date(exif_datetime)
+        if (date_from is None and date_to is None and image_filename is None
+                and exif_make is None and exif_model is None and not wanted):
             return []
 
-        conn = self._connect()
-        try:
-            cursor = conn.cursor(dictionary=True)
+        key = (
+            "search",
+            _as_date(date_from).isoformat() if date_from else None,
+            _as_date(date_to).isoformat() if date_to else None,
+            image_filename,
+            exif_make,
+            exif_model,
+            tuple(sorted(t.lower() for t in wanted)),
+            (tag_mode == "any") if wanted else None,
+            limit,
+            cursor,
+        )
+        deps = ["listing", "tags"] if wanted else ["listing"]
 
-            sql = f"SELECT * FROM image_info WHERE 1=1"
-            params: List[Any] = []
+        def load():
+            with self._connection() as conn:
+                cur = conn.cursor(dictionary=True)
+                where, params = self._filter_clause(date_from, date_to, image_filename, wanted, tag_mode,
+                                                    exif_make, exif_model)
+                page_sql, page_params = self._page_clause(cursor, limit)
+                cur.execute(f"SELECT * FROM {self.table} WHERE 1=1" + where + page_sql, params + page_params)
+                return cur.fetchall()
 
-            if exif_datetime is not None:
-                sql += " AND DATE(exif_datetime) = %s"
-                params.append(exif_datetime)
+        return self._cached(key, load, deps)
 
-            if image_filename is not None:
-                sql += " AND image_filename = %s"
-                params.append(image_filename)
+    def iter_search(
+        self,
+        exif_datetime: Optional[datetime] = None,
+        image_filename: Optional[str] = None,
+        exif_xpkeywords: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tag_mode: str = "all",
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        exif_make: Optional[str] = None,
+        exif_model: Optional[str] = None,
+        chunk_size: int = 1000,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Streaming variant of search() for exports. Same filters, but no
+        filter at all means every image. Yields EXPORT_COLUMNS rows in
+        PAGE_ORDER, at most chunk_size per list.
 
-            if exif_xpkeywords:
-                sql += " AND exif_xpkeywords like %s"
-                params.append(f"%{exif_xpkeywords}%")
-            
-            
-            cursor.execute(sql, params)
-            return cursor.fetchall()
+        Rows are read from an unbuffered (server-side) cursor, so memory
+        stays flat however many rows match. The connection is held until
+        the generator is exhausted or closed; the result cache is not used.
+        """
+        wanted = split_tags(",".join((tags or []) + [exif_xpkeywords or ""]))
+        if exif_datetime is not None:
+            date_from = date_to = _as_date(exif_datetime)
+        where, params = self._filter_clause(date_from, date_to, image_filename, wanted, tag_mode,
+                                            exif_make, exif_model)
+        sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {self.table} WHERE 1=1" + where + PAGE_ORDER
+        return self._stream(sql, params, chunk_size)
 
-        finally:
-            conn.close()
+    def iter_catalog(self, chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Every image_info row (IMAGE_COLUMNS) plus its stored EXIF as
+        "exif_data" (JSON text, None without an image_exif row), in id
+        order, at most chunk_size per list. Streamed like iter_search().
+        """
+        columns = ", ".join(f"i.{c}" for c in IMAGE_COLUMNS)
+        sql = (f"SELECT {columns}, e.data AS exif_data FROM {self.table} i "
+               f"LEFT JOIN image_exif e ON e.image_id = i.id ORDER BY i.id")
+        return self._stream(sql, [], chunk_size)
+
+    def _stream(self, sql: str, params: List[Any], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Run sql on an unbuffered cursor and yield its rows chunk_size at a time."""
+        with self._connection() as conn:
+            cur = conn.cursor(dictionary=True, buffered=False)
+            finished = False
+            try:
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        finished = True
+                        break
+                    yield rows
+            finally:
+                if not finished:
+                    # abandoned mid-stream (client went away): unread rows
+                    # must be drained before the pool can reuse the connection
+                    consume = getattr(conn, "consume_results", None)
+                    if consume is not None:
+                        consume()
+                cur.close()
+
+    def _filter_clause(
+        self,
+        date_from: Optional[date],
+        date_to: Optional[date],
+        image_filename: Optional[str],
+        wanted: List[str],
+        tag_mode: str,
+        exif_make: Optional[str] = None,
+        exif_model: Optional[str] = None,
+    ) -> Tuple[str, List[Any]]:
+        """ " AND ..." conditions shared by search() and iter_search()."""
+        sql = ""
+        params: List[Any] = []
+
+        if date_from is not None:
+            sql += " AND exif_datetime >= %s"
+            params.append(datetime.combine(_as_date(date_from), datetime.min.time()))
+
+        if date_to is not None:
+            sql += " AND exif_datetime < %s"
+            params.append(datetime.combine(_as_date(date_to) + timedelta(days=1), datetime.min.time()))
+
+        if image_filename is not None:
+            sql += " AND image_filename = %s"
+            params.append(image_filename)
+
+        if exif_make is not None:
+            sql += " AND exif_make = %s"
+            params.append(exif_make)
+
+        if exif_model is not None:
+            sql += " AND exif_model = %s"
+            params.append(exif_model)
+
+        if wanted:
+            marks = ", ".join(["%s"] * len(wanted))
+            if tag_mode == "any":
+                sql += f" AND id IN (SELECT image_id FROM image_tags WHERE tag IN ({marks}))"
+                params += wanted
+            else:
+                sql += (f" AND id IN (SELECT image_id FROM image_tags WHERE tag IN ({marks})"
+                        f" GROUP BY image_id HAVING COUNT(*) = %s)")
+                params += wanted + [len(wanted)]
+        return sql, params
 # ------------ GET FULL_PATH ------------
+    @db_method
     def get_full_path(self):
-        conn = self._connect()
-        try:
-            cursor = conn.cursor()
-            command = f"SELECT full_path from {self.table} "
-            
-            cursor.execute(command)
-            result = cursor.fetchall()
-            return result
-    
-        except Exception as e :
-            return f"{e}"
-        finally:
-            conn.close()       
+        with self._connection() as conn:
+            try:
+                cursor = conn.cursor()
+                command = f"SELECT full_path from {self.table} "
+                
+                cursor.execute(command)
+                result = cursor.fetchall()
+                return result
+        
+            except Exception as e :
+                return f"{e}"
 # --------- GET ALL IMAGES ---------------
-    def get_all_images(self, limit: int = 500):
-        conn = self._connect()
-        try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(
-                f"SELECT image_filename, full_path, exif_datetime, exif_make, exif_model, exif_xpkeywords "
-                f"FROM {self.table} "
-                f"ORDER BY exif_datetime DESC "
-                f"LIMIT %s",
-                (limit,),
-            )
-            return cursor.fetchall()
-        finally:
-            conn.close()
+    @db_method
+    def get_all_images(self, limit: int = 500, cursor: Optional[str] = None):
+        def load():
+            with self._connection() as conn:
+                cur = conn.cursor(dictionary=True)
+                page_sql, page_params = self._page_clause(cursor, limit)
+                cur.execute(
+                    f"SELECT image_filename, full_path, exif_datetime, exif_make, exif_model, exif_xpkeywords "
+                    f"FROM {self.table} "
+                    f"WHERE 1=1" + page_sql,
+                    page_params,
+                )
+                return cur.fetchall()
+
+        return self._cached(("get_all_images", int(limit), cursor), load, ["listing"])
+
+    def _page_clause(self, cursor: Optional[str], limit: Optional[int]) -> Tuple[str, List[Any]]:
+        """
+        Keyset condition + ORDER BY + LIMIT. Seeks past the cursor row
+        instead of OFFSET, so page N costs the same as page 1.
+        NULL dates sort last (MySQL DESC), hence the IS NULL branches.
+        """
+        sql = ""
+        params: List[Any] = []
+        if cursor:
+            dt, full_path = decode_cursor(cursor)
+            if dt is None:
+                sql += " AND exif_datetime IS NULL AND full_path < %s"
+                params.append(full_path)
+            else:
+                sql += (" AND (exif_datetime < %s"
+                        " OR (exif_datetime = %s AND full_path < %s)"
+                        " OR exif_datetime IS NULL)")
+                params += [dt, dt, full_path]
+
+        sql += PAGE_ORDER
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(int(limit))
+        return sql, params
 # ----------- GET TAGS ---------
+    @db_method
     def get_tags(self, full_path: str):
-        conn = self._connect()
-        
-        try:
-            cursor = conn.cursor(dictionary = True)
-            sql = (f"""
-                select exif_xpkeywords from {self.table}
-                where full_path = %s
-                """
-            )
-            cursor.execute(sql, (full_path,))
-            row = cursor.fetchone()
-            return None if row is None else row["exif_xpkeywords"]
-        finally:
-            conn.close()
+        def load():
+            with self._connection() as conn:
+                cursor = conn.cursor(dictionary = True)
+                sql = (f"""
+                    select exif_xpkeywords from {self.table}
+                    where full_path = %s
+                    """
+                )
+                cursor.execute(sql, (full_path,))
+                row = cursor.fetchone()
+                return None if row is None else row["exif_xpkeywords"]
+
+        return self._cached(("get_tags", _path_dep(full_path)), load, [_path_dep(full_path)])
 # -------- UPDATE TAG INFO ------------  
+    @db_method
     def update_tag_info(self, full_path : str ,tag_value : str):
-        
-        conn = self._connect()
-        try:
+        """
+        Set the tag string of one image and rebuild its image_tags rows in
+        the same transaction. Returns rows updated; errors propagate so the
+        transaction (or the surrounding session()) rolls back.
+        """
+        with self._connection() as conn:
             cursor = conn.cursor()
-            f = full_path
-            params: List[Any] = []
-            print(f)
-        
             command = f"UPDATE {self.table} SET exif_xpkeywords = %s where full_path = %s"
-            params.append(tag_value)
-            params.append(f)
-            cursor.execute(command,params)
-            conn.commit()
+            cursor.execute(command, (tag_value, full_path))
             result = cursor.rowcount
+            # same transaction: the tag index never disagrees with the string
+            self._sync_tags(cursor, [full_path])
+            self._invalidate("tags", _path_dep(full_path))
             return result
-    
-        except Exception as e :
-            return f"{e}"
-        finally:
-            conn.close()
+# -------- BATCH TAG EDITS ------------
+    @db_method
+    def get_tags_for_update(self, full_paths: List[str]) -> Dict[str, Optional[str]]:
+        """
+        exif_xpkeywords of each existing path, read with SELECT ... FOR UPDATE
+        so the rows stay locked until the surrounding session() commits.
+        Paths without a row are left out.
+        """
+        out: Dict[str, Optional[str]] = {}
+        with self._connection() as conn:
+            cur = conn.cursor()
+            lock = self.backend.for_update(conn)
+            for i in range(0, len(full_paths), 500):
+                chunk = full_paths[i:i + 500]
+                marks = ", ".join(["%s"] * len(chunk))
+                cur.execute(
+                    f"SELECT full_path, exif_xpkeywords FROM {self.table} "
+                    f"WHERE full_path IN ({marks})" + lock,
+                    chunk,
+                )
+                out.update(dict(cur.fetchall()))
+        return out
+
+    @db_method
+    def update_tags_many(self, new_tags: Dict[str, str]) -> int:
+        """
+        {full_path: tag string} -> one executemany UPDATE plus an
+        image_tags resync, in a single transaction.
+        Returns number of rows updated.
+        """
+        if not new_tags:
+            return 0
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(
+                f"UPDATE {self.table} SET exif_xpkeywords = %s WHERE full_path = %s",
+                [(tags, path) for path, tags in new_tags.items()],
+            )
+            rc = cur.rowcount
+            paths = list(new_tags)
+            for i in range(0, len(paths), 500):
+                self._sync_tags(cur, paths[i:i + 500])
+            self._invalidate("tags", *(_path_dep(p) for p in paths))
+            return rc
 # --------- UPDATE METADATA ------
+    @db_method
     def update_metadata_info(self,full_path: str | None,exif_datetime: str | None,exif_make: str | None,exif_model: str | None):
-        conn = self._connect()
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
             sql = f"""
             UPDATE {self.table}
@@ -231,24 +844,244 @@ class ImageDBService:
                 exif_model    = COALESCE(%s, exif_model)
             WHERE full_path = %s
             """
-            dt = None
-            if exif_datetime:
-                exif_datetime = exif_datetime.strip()
-                for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
-                    try:
-                        dt = datetime.strptime(exif_datetime, fmt)
-                        break
-                    except ValueError:
-                        pass
-
+            dt = _as_datetime(exif_datetime) if exif_datetime else None
             cursor.execute(sql, (dt, exif_make, exif_model, full_path))
-            conn.commit()
+            # date changes move the row in every date-ordered listing
+            self._invalidate("listing", _path_dep(full_path))
             return cursor.rowcount
-        finally:
-            conn.close()
+# --------- ROWS BY ID (in-memory indexes) ------
+    @db_method
+    def get_facet_rows(
+        self,
+        ids: Optional[List[int]] = None,
+        after_id: int = 0,
+        limit: int = 5000,
+    ) -> List[Tuple[Any, ...]]:
+        """
+        (id, full_path, exif_make, exif_model, exif_datetime, exif_xpkeywords)
+        of the given ids, or else of the next limit rows by id after after_id.
+        Ids without a row are left out.
+        """
+        return self._rows_by_id("id, full_path, exif_make, exif_model, exif_datetime, exif_xpkeywords",
+                                ids, after_id, limit)
+
+    @db_method
+    def get_phash_rows(
+        self,
+        ids: Optional[List[int]] = None,
+        after_id: int = 0,
+        limit: int = 5000,
+    ) -> List[Tuple[Any, ...]]:
+        """(id, full_path, phash or None), selected like get_facet_rows()."""
+        return self._rows_by_id("id, full_path, phash", ids, after_id, limit)
+
+    def _rows_by_id(
+        self,
+        columns: str,
+        ids: Optional[List[int]],
+        after_id: int,
+        limit: int,
+    ) -> List[Tuple[Any, ...]]:
+        with self._connection() as conn:
+            cur = conn.cursor()
+            if ids is None:
+                cur.execute(
+                    f"SELECT {columns} FROM {self.table} WHERE id > %s ORDER BY id LIMIT %s",
+                    (int(after_id), int(limit)),
+                )
+                return cur.fetchall()
+
+            out: List[Tuple[Any, ...]] = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ", ".join(["%s"] * len(chunk))
+                cur.execute(f"SELECT {columns} FROM {self.table} WHERE id IN ({marks})", chunk)
+                out += cur.fetchall()
+            return out
+# --------- PERCEPTUAL HASHES ------
+    @db_method
+    def get_paths_missing(self, column: str, after: Optional[str], limit: int) -> List[str]:
+        """Next limit full_paths (ordered, after the given one) whose hash column is NULL."""
+        if column not in HASH_COLUMNS:
+            raise ValueError(f"not a hash column: {column}")
+        with self._connection() as conn:
+            cur = conn.cursor()
+            sql = f"SELECT full_path FROM {self.table} WHERE {column} IS NULL"
+            params: List[Any] = []
+            if after is not None:
+                sql += " AND full_path > %s"
+                params.append(after)
+            cur.execute(sql + " ORDER BY full_path LIMIT %s", params + [int(limit)])
+            return [r[0] for r in cur.fetchall()]
+
+    @db_method
+    def update_hashes(self, column: str, hashes: Dict[str, str]) -> int:
+        """{full_path: hex} -> one executemany UPDATE of a hash column. Returns rows updated."""
+        if column not in HASH_COLUMNS:
+            raise ValueError(f"not a hash column: {column}")
+        if not hashes:
+            return 0
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(
+                f"UPDATE {self.table} SET {column} = %s WHERE full_path = %s",
+                [(h, p) for p, h in hashes.items()],
+            )
+            self._invalidate(column, *(_path_dep(p) for p in hashes))
+            return cur.rowcount
+# --------- MOVED / RENAMED FILES ------
+    @db_method
+    def get_content_hashes(self, full_paths: List[str]) -> Dict[str, str]:
+        """{full_path: content_hash} for those of full_paths that have one."""
+        out: Dict[str, str] = {}
+        with self._connection() as conn:
+            cur = conn.cursor()
+            for i in range(0, len(full_paths), 500):
+                chunk = full_paths[i:i + 500]
+                marks = ", ".join(["%s"] * len(chunk))
+                cur.execute(
+                    f"SELECT full_path, content_hash FROM {self.table} "
+                    f"WHERE content_hash IS NOT NULL AND full_path IN ({marks})",
+                    chunk,
+                )
+                out.update(cur.fetchall())
+        return out
+
+    @db_method
+    def move_images(self, moves: Dict[str, str]) -> Dict[str, str]:
+        """
+        {old full_path: new full_path} -> re-point the rows, keeping id,
+        metadata and tags (image_tags is keyed by id). A pair whose new
+        path already has a row is skipped; the caller extracts that file
+        and deletes the old row as usual.
+
+        Returns the moves that were applied.
+        """
+        if not moves:
+            return {}
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            targets = list(moves.values())
+            taken = set()
+            for i in range(0, len(targets), 500):
+                chunk = targets[i:i + 500]
+                marks = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"SELECT full_path FROM {self.table} WHERE full_path IN ({marks})", chunk)
+                taken.update(r[0] for r in cursor.fetchall())
+
+            applied = {old: new for old, new in moves.items() if new not in taken}
+            if applied:
+                cursor.executemany(
+                    f"UPDATE {self.table} SET full_path = %s, image_filename = %s WHERE full_path = %s",
+                    [(new, Path(new).name, old) for old, new in applied.items()],
+                )
+                self._invalidate("listing", *(_path_dep(p) for pair in applied.items() for p in pair))
+            return applied
+# --------- STORED EXIF (image_exif) ------
+    @db_method
+    def get_exif(self, full_path: str) -> Optional[Dict[str, Any]]:
+        """Stored extra EXIF tags of one image ({TagName: value}), None if nothing is stored."""
+        def load():
+            with self._connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    f"SELECT e.data FROM image_exif e JOIN {self.table} i ON i.id = e.image_id "
+                    f"WHERE i.full_path = %s",
+                    (full_path,),
+                )
+                row = cur.fetchone()
+                return None if row is None else json.loads(row[0])
+
+        return self._cached(("get_exif", _path_dep(full_path)), load, [_path_dep(full_path)])
+
+    @db_method
+    def search_exif(
+        self,
+        lens_model: Optional[str] = None,
+        iso_min: Optional[int] = None,
+        iso_max: Optional[int] = None,
+        focal_min: Optional[float] = None,
+        focal_max: Optional[float] = None,
+        f_number_max: Optional[float] = None,
+        orientation: Optional[int] = None,
+        fields: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = 100,
+        cursor: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        image_info rows (PAGE_ORDER, keyset paged like search()) filtered
+        on the stored EXIF: ranges on the promoted columns, lens_model
+        exact, and fields = {TagName: value} equality on any other stored
+        tag (read from the JSON, so no index).
+
+        Only images ingested with exif.store enabled can match.
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        for sql, value in (
+            ("e.lens_model = %s", lens_model),
+            ("e.iso >= %s", iso_min),
+            ("e.iso <= %s", iso_max),
+            ("e.focal_length >= %s", focal_min),
+            ("e.focal_length <= %s", focal_max),
+            ("e.f_number <= %s", f_number_max),
+            ("e.orientation = %s", orientation),
+        ):
+            if value is not None:
+                where.append(sql)
+                params.append(value)
+        for name, value in (fields or {}).items():
+            if not name.isidentifier():
+                raise ValueError(f"invalid EXIF tag name {name!r}")
+            where.append(f"{self.backend.json_text('e.data')} = %s")
+            params += [f'$."{name}"', value]
+
+        key = ("search_exif", tuple(where), tuple(map(str, params)), limit, cursor)
+
+        def load():
+            with self._connection() as conn:
+                cur = conn.cursor(dictionary=True)
+                page_sql, page_params = self._page_clause(cursor, limit)
+                sql = (
+                    f"SELECT i.* FROM {self.table} i JOIN image_exif e ON e.image_id = i.id WHERE 1=1"
+                    + "".join(" AND " + w for w in where)
+                )
+                cur.execute(sql + page_sql, params + page_params)
+                return cur.fetchall()
+
+        return self._cached(key, load, ["listing"])
+# --------- DELETE IMAGES ------
+    @db_method
+    def delete_images(self, full_paths: List[str]) -> int:
+        """
+        Remove the rows of files that no longer exist on disk.
+        Returns number of rows deleted.
+        """
+        if not full_paths:
+            return 0
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            deleted = 0
+            # chunk so a huge delete doesn't build a giant IN (...) list
+            for i in range(0, len(full_paths), 500):
+                chunk = full_paths[i:i + 500]
+                marks = ", ".join(["%s"] * len(chunk))
+                for side in ("image_tags", "image_exif"):
+                    cursor.execute(
+                        f"DELETE FROM {side} WHERE image_id IN "
+                        f"(SELECT id FROM {self.table} WHERE full_path IN ({marks}))",
+                        chunk,
+                    )
+                cursor.execute(f"DELETE FROM {self.table} WHERE full_path IN ({marks})", chunk)
+                deleted += cursor.rowcount
+                self._invalidate("listing", *(_path_dep(p) for p in chunk))
+            return deleted
 # ---------- BACKEND FOR WEBSITE -------------
 if __name__ == "__main__":
+    from filereader import ExifDataFrameBuilder
+
     db_service = ImageDBService(Config("config.yaml"))
     builder = ExifDataFrameBuilder(Config("config.yaml"))
     df = builder.build_dataframe()
-    
@@ -0,0 +1,371 @@
+# exifheader.py
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Set, Tuple
+
+# TIFF field type -> size in bytes of one value
+_TYPE_SIZES = {
+    1: 1,   # BYTE
+    2: 1,   # ASCII
+    3: 2,   # SHORT
+    4: 4,   # LONG
+    5: 8,   # RATIONAL
+    6: 1,   # SBYTE
+    7: 1,   # UNDEFINED
+    8: 2,   # SSHORT
+    9: 4,   # SLONG
+    10: 8,  # SRATIONAL
+    11: 4,  # FLOAT
+    12: 8,  # DOUBLE
+    13: 4,  # IFD
+}
+
+_JPEG_SOI = b"\xff\xd8"
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"}
+
+# how much of a JPEG we are willing to walk before giving up on finding APP1
+_MAX_JPEG_HEADER = 1 << 20
+
+# IFD0 entry pointing at the Exif sub-IFD (ISO, exposure, lens, DateTimeOriginal ...)
+EXIF_IFD_POINTER = 0x8769
+
+
+def read_exif(path: str | Path, tags: Set[int] | None = None) -> Optional[Dict[int, Any]]:
+    """
+    Read EXIF entries straight from the file header, without decoding
+    any pixel data.
+
+    Supports JPEG (APP1 segment) and HEIF/HEIC (the 'Exif' item of the
+    meta box). Values come back in the same shape Pillow's getexif() uses:
+    ASCII -> str, BYTE/UNDEFINED -> bytes, single numbers -> int/float.
+
+    tags: only these tag ids are decoded, looked up in IFD0 and then
+          in the Exif sub-IFD (None = all of IFD0)
+
+    Returns:
+      {tag_id: value}  - format understood ({} if it has no EXIF)
+      None             - not a supported format / unparseable,
+                         caller should fall back to Pillow
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            f.seek(0)
+
+            if head[:2] == _JPEG_SOI:
+                tiff = _jpeg_exif_block(f)
+            elif head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+                tiff = _heif_exif_block(f)
+            else:
+                return None
+
+        if tiff is None:
+            return {}
+        return parse_tiff(tiff, tags)
+
+    except (OSError, struct.error, ValueError, IndexError):
+        # IndexError: a truncated box indexed past its end (iinf/iloc)
+        return None
+
+
+def parse_tiff(data: bytes, tags: Set[int] | None = None) -> Dict[int, Any]:
+    """
+    Parse a TIFF-structured EXIF block ("II*\\0" / "MM\\0*").
+    Only the entries listed in tags are decoded; tags missing from IFD0
+    are looked for in the Exif sub-IFD. tags=None decodes all of IFD0.
+    """
+    if data[:2] == b"II":
+        bo = "<"
+    elif data[:2] == b"MM":
+        bo = ">"
+    else:
+        raise ValueError("not a TIFF header")
+
+    if struct.unpack_from(bo + "H", data, 2)[0] != 42:
+        raise ValueError("bad TIFF magic")
+
+    ifd0 = struct.unpack_from(bo + "I", data, 4)[0]
+    if tags is None:
+        return _parse_ifd(data, bo, ifd0, None)
+
+    out = _parse_ifd(data, bo, ifd0, tags | {EXIF_IFD_POINTER})
+    pointer = out.get(EXIF_IFD_POINTER) if EXIF_IFD_POINTER in tags else out.pop(EXIF_IFD_POINTER, None)
+    rest = tags - out.keys()
+    if rest and isinstance(pointer, int) and 8 <= pointer < len(data):
+        for tag, value in _parse_ifd(data, bo, pointer, rest).items():
+            out.setdefault(tag, value)
+    return out
+
+
+# -----------------------------
+# Internal helpers
+# -----------------------------
+def _parse_ifd(data: bytes, bo: str, ifd: int, tags: Set[int] | None) -> Dict[int, Any]:
+    count = struct.unpack_from(bo + "H", data, ifd)[0]
+
+    out: Dict[int, Any] = {}
+    for i in range(count):
+        entry = ifd + 2 + 12 * i
+        tag, typ, n = struct.unpack_from(bo + "HHI", data, entry)
+        if tags is not None and tag not in tags:
+            continue
+
+        size = _TYPE_SIZES.get(typ)
+        if size is None:
+            continue
+
+        total = size * n
+        if total <= 4:
+            raw = data[entry + 8:entry + 8 + total]
+        else:
+            offset = struct.unpack_from(bo + "I", data, entry + 8)[0]
+            raw = data[offset:offset + total]
+            if len(raw) != total:
+                continue  # points outside the block
+
+        out[tag] = _decode_value(bo, typ, n, raw)
+
+    return out
+
+
+def _decode_value(bo: str, typ: int, n: int, raw: bytes) -> Any:
+    if typ == 2:
+        # ASCII, NUL terminated
+        if raw.endswith(b"\0"):
+            raw = raw[:-1]
+        return raw.decode("latin-1", "replace")
+
+    if typ in (1, 7):
+        return bytes(raw)
+
+    if typ in (5, 10):
+        fmt = bo + ("I" if typ == 5 else "i") * (2 * n)
+        nums = struct.unpack(fmt, raw)
+        values = tuple(
+            (nums[i] / nums[i + 1]) if nums[i + 1] else float("nan")
+            for i in range(0, len(nums), 2)
+        )
+        return values[0] if n == 1 else values
+
+    code = {3: "H", 4: "I", 6: "b", 8: "h", 9: "i", 11: "f", 12: "d", 13: "I"}[typ]
+    values = struct.unpack(bo + code * n, raw)
+    return values[0] if n == 1 else values
+
+
+def _jpeg_exif_block(f: BinaryIO) -> Optional[bytes]:
+    """Walk JPEG marker segments until APP1/Exif or start-of-scan."""
+    f.seek(2)
+    while f.tell() < _MAX_JPEG_HEADER:
+        b = f.read(1)
+        if b != b"\xff":
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+
+        m = marker[0]
+        if m in (0xD9, 0xDA):  # EOI / SOS: no EXIF before image data
+            return None
+        if m == 0x01 or 0xD0 <= m <= 0xD7:  # standalone markers
+            continue
+
+        length = struct.unpack(">H", f.read(2))[0]
+        if length < 2:
+            return None
+
+        if m == 0xE1:
+            payload = f.read(length - 2)
+            if payload[:6] == b"Exif\0\0":
+                return payload[6:]
+            # APP1 can also be XMP -> keep looking
+        else:
+            f.seek(length - 2, 1)
+    return None
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: int | None = None) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Iterate ISOBMFF boxes inside data[start:end].
+    Yields (box_type, payload_start, payload_end).
+    """
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _iter_file_boxes(f: BinaryIO, start: int = 0, end: int | None = None) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Same as _iter_boxes() but seeks through a file, so large boxes
+    (mdat) are skipped without being read.
+    """
+    if end is None:
+        f.seek(0, 2)
+        end = f.tell()
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        head = f.read(16)
+        if len(head) < 8:
+            return
+        size, box_type = struct.unpack_from(">I4s", head, 0)
+        header = 8
+        if size == 1:
+            if len(head) < 16:
+                return
+            size = struct.unpack_from(">Q", head, 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _read_uint(data: bytes, pos: int, size: int) -> Tuple[int, int]:
+    """Big-endian unsigned int of 0/4/8 bytes; returns (value, new_pos)."""
+    if size == 0:
+        return 0, pos
+    if size == 4:
+        return struct.unpack_from(">I", data, pos)[0], pos + 4
+    if size == 8:
+        return struct.unpack_from(">Q", data, pos)[0], pos + 8
+    raise ValueError(f"unsupported iloc field size {size}")
+
+
+def _heif_exif_block(f: BinaryIO) -> Optional[bytes]:
+    """
+    Locate the 'Exif' item of a HEIF file:
+      meta -> iinf/infe (which item id is Exif) -> iloc (where it lives)
+    """
+    meta = None
+    for box_type, start, end in _iter_file_boxes(f):
+        if box_type == b"meta":
+            f.seek(start)
+            meta = f.read(end - start)
+            break
+    if meta is None:
+        return None
+
+    # meta is a FullBox: skip version + flags
+    exif_id = None
+    locations: Dict[int, list] = {}
+    for box_type, start, end in _iter_boxes(meta, 4):
+        if box_type == b"iinf":
+            exif_id = _parse_iinf(meta, start, end)
+        elif box_type == b"iloc":
+            locations = _parse_iloc(meta, start)
+
+    if exif_id is None or exif_id not in locations:
+        return None
+
+    chunks = []
+    for offset, length in locations[exif_id]:
+        f.seek(offset)
+        chunks.append(f.read(length))
+    item = b"".join(chunks)
+
+    # Exif item = 4-byte offset to the TIFF header, then (usually) "Exif\0\0"
+    if len(item) < 4:
+        return None
+    skip = struct.unpack_from(">I", item, 0)[0]
+    tiff = item[4 + skip:]
+    if tiff[:6] == b"Exif\0\0":
+        tiff = tiff[6:]
+    return tiff
+
+
+def _parse_iinf(meta: bytes, start: int, end: int) -> Optional[int]:
+    version = meta[start]
+    pos = start + 4
+    pos += 2 if version == 0 else 4  # entry_count
+
+    for box_type, s, e in _iter_boxes(meta, pos, end):
+        if box_type != b"infe":
+            continue
+        infe_version = meta[s]
+        if infe_version < 2:
+            continue
+        p = s + 4
+        if infe_version == 2:
+            item_id = struct.unpack_from(">H", meta, p)[0]
+            p += 2
+        else:
+            item_id = struct.unpack_from(">I", meta, p)[0]
+            p += 4
+        p += 2  # item_protection_index
+        if meta[p:p + 4] == b"Exif":
+            return item_id
+    return None
+
+
+def _parse_iloc(meta: bytes, start: int) -> Dict[int, list]:
+    """item_id -> [(file_offset, length), ...] (file-offset items only)."""
+    version = meta[start]
+    pos = start + 4
+
+    offset_size = meta[pos] >> 4
+    length_size = meta[pos] & 0x0F
+    base_offset_size = meta[pos + 1] >> 4
+    index_size = meta[pos + 1] & 0x0F if version in (1, 2) else 0
+    pos += 2
+
+    if version < 2:
+        item_count = struct.unpack_from(">H", meta, pos)[0]
+        pos += 2
+    else:
+        item_count = struct.unpack_from(">I", meta, pos)[0]
+        pos += 4
+
+    out: Dict[int, list] = {}
+    for _ in range(item_count):
+        if version < 2:
+            item_id = struct.unpack_from(">H", meta, pos)[0]
+            pos += 2
+        else:
+            item_id = struct.unpack_from(">I", meta, pos)[0]
+            pos += 4
+
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from(">H", meta, pos)[0] & 0x0F
+            pos += 2
+        pos += 2  # data_reference_index
+
+        base_offset, pos = _read_uint(meta, pos, base_offset_size)
+        extent_count = struct.unpack_from(">H", meta, pos)[0]
+        pos += 2
+
+        extents = []
+        for _ in range(extent_count):
+            if index_size:
+                _, pos = _read_uint(meta, pos, index_size)
+            extent_offset, pos = _read_uint(meta, pos, offset_size)
+            extent_length, pos = _read_uint(meta, pos, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+
+        if construction_method == 0:
+            out[item_id] = extents
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+
+    for arg in sys.argv[1:]:
+        print(arg, read_exif(arg))
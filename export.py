@@ -0,0 +1,102 @@
+# export.py
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List
+
+from config import Config
+from database import EXPORT_COLUMNS, ImageDBService
+
+# Catalog slices as NDJSON (one JSON object per line) or CSV, streamed:
+# rows come from ImageDBService.iter_search() chunk by chunk and each
+# chunk is encoded and handed on before the next one is read.
+#
+#   python export.py --tag sky --from 2020-01-01 --format csv -o sky.csv
+#   curl 'http://host:5000/api/export?g=sky&from=2020-01-01&format=ndjson'
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def encode_chunks(chunks: Iterable[List[Dict[str, Any]]], fmt: str) -> Iterator[str]:
+    """
+    Encode row chunks (as yielded by iter_search) to text, one string per
+    chunk. CSV starts with a header line, even if nothing matches.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(EXPORT_COLUMNS)
+        yield buf.getvalue()
+        for rows in chunks:
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows([_plain(r.get(c)) for c in EXPORT_COLUMNS] for r in rows)
+            yield buf.getvalue()
+        return
+
+    for rows in chunks:
+        yield "".join(
+            json.dumps({c: _plain(r.get(c)) for c in EXPORT_COLUMNS}, ensure_ascii=False) + "\n"
+            for r in rows
+        )
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream image_info rows matching search filters as NDJSON or CSV.")
+    parser.add_argument("--date", help="one day, YYYY-MM-DD")
+    parser.add_argument("--from", dest="date_from", help="first day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="last day (inclusive), YYYY-MM-DD")
+    parser.add_argument("--filename", help="exact image_filename")
+    parser.add_argument("--tag", action="append", default=[], help="repeatable")
+    parser.add_argument("--any", action="store_true", help="match any tag instead of all")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    parser.add_argument("--config", default="config.yaml")
+    args = parser.parse_args(argv)
+
+    def day(value):
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+    db = ImageDBService(Config(args.config))
+    chunks = db.iter_search(
+        exif_datetime=day(args.date),
+        image_filename=args.filename,
+        tags=args.tag,
+        tag_mode="any" if args.any else "all",
+        date_from=day(args.date_from),
+        date_to=day(args.date_to),
+        chunk_size=args.chunk_size,
+    )
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        for text in encode_chunks(chunks, args.format):
+            out.write(text)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# facets.py
+from __future__ import annotations
+
+import heapq
+import sys
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from rowindex import RowIndex
+from tagmanager import split_tags
+
+# Image counts per camera make, model, year and tag for the gallery's
+# filter chips. A GROUP BY over image_info on every page view would be a
+# full scan each time, so the counts live in memory: built once from the
+# database, then patched from the write listener's deltas (see RowIndex).
+#
+# Answering a request is a dict lookup while nothing has been written;
+# after a write it costs one small query for the touched rows.
+
+FACETS = ("make", "model", "year", "tag")
+
+# one entry per image: (make, model, year, tags)
+_Row = Tuple[Optional[str], Optional[str], Optional[int], Tuple[str, ...]]
+
+
+class FacetIndex(RowIndex):
+    """
+    In-memory facet counts of image_info, kept current through
+    ImageDBService.add_write_listener().
+
+    Writes made by other processes (a separate watcher, CLI ingest) send
+    no events here; max_age seconds after the last full build the index
+    is rebuilt in the background (0 = never), the old counts being
+    served meanwhile.
+
+    make, model and tag are counted case-insensitively, as the gallery
+    filters match them; each is shown in its most common spelling.
+    """
+
+    deps = ("listing", "tags")
+
+    def __init__(self, db, max_age: float = 300):
+        # the expiry rebuild scans all of image_info: keep it off requests
+        super().__init__(db, max_age, background=True)
+
+    def counts(self, limit: int = 20) -> Dict[str, Any]:
+        """
+        {"total": images, "make": [{"value", "count"}, ...], "model": ...,
+         "tag": ...} most common first (ties by value), at most limit each,
+        and "year" newest first (every year). Images without a value are
+        not counted under that facet.
+        """
+        limit = max(1, int(limit))
+        with self._lock:
+            self._refresh()
+            out = self._output.get(limit)
+            if out is None:
+                out = {"total": len(self._rows)}
+                for name in ("make", "model", "tag"):
+                    top = heapq.nsmallest(limit, self._counts[name].items(), key=lambda kv: (-kv[1], kv[0]))
+                    out[name] = [{"value": self._spelling(name, key), "count": n} for key, n in top]
+                out["year"] = [{"value": y, "count": n} for y, n in sorted(self._counts["year"].items(), reverse=True)]
+                self._output[limit] = out
+            return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._refresh()
+            return {"images": len(self._rows), **{name: len(c) for name, c in self._counts.items()}}
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _fetch(self, ids: Optional[Sequence[int]] = None, after_id: int = 0) -> List[Tuple[Any, ...]]:
+        return self.db.get_facet_rows(ids=ids, after_id=after_id)
+
+    def _clear(self) -> None:
+        self._counts: Dict[str, Counter] = {name: Counter() for name in FACETS}   # keyed by _fold()
+        self._spellings: Dict[str, Dict[str, Counter]] = {name: {} for name in FACETS}   # folded -> spellings
+        self._output: Dict[int, Dict[str, Any]] = {}   # limit -> counts(); cleared on change
+
+    def _changed(self) -> None:
+        self._output.clear()
+
+    def _add(self, row: Tuple[Any, ...]) -> _Row:
+        _, _, make, model, taken, keywords = row
+        entry: _Row = (
+            sys.intern(make) if make else None,
+            sys.intern(model) if model else None,
+            _year(taken),
+            tuple(sys.intern(t) for t in split_tags(keywords)),
+        )
+        self._count(entry, 1)
+        return entry
+
+    def _discard(self, entry: _Row) -> None:
+        self._count(entry, -1)
+
+    def _count(self, entry: _Row, step: int) -> None:
+        make, model, year, tags = entry
+        for name, value in (("make", make), ("model", model), ("year", year)):
+            if value is not None:
+                self._bump(name, value, step)
+        for tag in tags:
+            self._bump("tag", tag, step)
+
+    def _bump(self, name: str, value: Any, step: int) -> None:
+        key = _fold(value)
+        self._add_to(self._counts[name], key, step)
+        spellings = self._spellings[name].setdefault(key, Counter())
+        self._add_to(spellings, value, step)
+        if not spellings:
+            del self._spellings[name][key]
+
+    def _spelling(self, name: str, key: Any) -> Any:
+        return min(self._spellings[name][key].items(), key=lambda kv: (-kv[1], kv[0]))[0]
+
+    @staticmethod
+    def _add_to(counter: Counter, value: Any, step: int) -> None:
+        n = counter[value] + step
+        if n > 0:
+            counter[value] = n
+        else:
+            del counter[value]
+
+
+def _fold(value: Any) -> Any:
+    """Facet key: the filters compare make, model and tags case-insensitively."""
+    return sys.intern(value.casefold()) if isinstance(value, str) else value
+
+
+def _year(value: Any) -> Optional[int]:
+    """exif_datetime (datetime, or text from drivers that return it) -> year."""
+    if value is None:
+        return None
+    year = getattr(value, "year", None)
+    if year is None and str(value)[:4].isdigit():
+        year = int(str(value)[:4])
+    return year or None
+
+
+if __name__ == "__main__":
+    from config import Config
+    from database import ImageDBService
+
+    cfg = Config("config.yaml")
+    index = FacetIndex(ImageDBService(cfg), cfg.FACETS_MAX_AGE)
+    result = index.counts(cfg.FACETS_LIMIT)
+    print(f"{result['total']} images")
+    for name in FACETS:
+        print(f"-- {name}")
+        for item in result[name]:
+            print(f"   {item['count']:>7}  {item['value']}")
@@ -1,25 +1,61 @@
 # exif_reader.py
 from __future__ import annotations
 
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
 
 import pandas as pd
 from PIL import Image, ExifTags
 
 from config import Config
+from exifheader import EXIF_IFD_POINTER, read_exif
+from fingerprint import content_hash
+from manifest import FileManifest, ManifestChanges
+from metrics import INGEST_FILES, ingest_stage
+from phash import dhash, to_hex
 from reader import FileReader
+from videoheader import read_video_meta
+
+log = logging.getLogger(__name__)
+
+# image_info columns are filled from these; every profile parses them
+CORE_TAGS = ("Make", "Model", "DateTime", "XPKeywords")
+
+# exif.profile -> further tag names to parse (None = every tag Pillow
+# knows except the ones below). config exif.profiles adds more.
+EXIF_PROFILES: Dict[str, Optional[Tuple[str, ...]]] = {
+    "basic": (),
+    "camera": (
+        "Orientation", "DateTimeOriginal", "OffsetTimeOriginal", "ISOSpeedRatings",
+        "FNumber", "ExposureTime", "FocalLength", "FocalLengthIn35mmFilm",
+        "LensMake", "LensModel", "Flash", "ExifImageWidth", "ExifImageHeight",
+    ),
+    "full": None,
+}
+
+# vendor blobs (MakerNote is often tens of KB) and sub-IFD pointers
+_SKIPPED_TAGS = {"MakerNote", "PrintImageMatching", "UserComment", "ExifOffset", "GPSInfo"}
 
 
 class ExifDataFrameBuilder:
     def __init__(self, config: Config | None = None):
         self.config = config or Config()
         self.reader = FileReader(self.config)
+        self.manifest = FileManifest(self.config)
 
         # Map EXIF numeric tag -> human-readable name
         self._exif_tag_map = {k: v for k, v in ExifTags.TAGS.items()}
 
+        # only the tags of the configured profile are parsed
+        self._wanted_tags = self._profile_tags(self.config.EXIF_PROFILE)
+
     def build_dataframe(self, folder_path: str | Path | None = None) -> pd.DataFrame:
         """
         Reads images (including subfolders), extracts:
@@ -34,21 +70,83 @@ class ExifDataFrameBuilder:
         base_folder = Path(folder_path) if folder_path else Path(self.config.UPLOAD_FOLDER)
 
         rel_files = self.reader.read_images(base_folder)
-        rows: List[Dict[str, Any]] = []
+        return self._frame_from_paths([(base_folder / rel).resolve() for rel in rel_files])
+
+    def scan_changes(self, folder_path: str | Path | None = None) -> ManifestChanges:
+        """
+        Stat-only walk of the folder compared against the manifest.
+        No image is opened here.
+        """
+        base_folder = Path(folder_path) if folder_path else Path(self.config.UPLOAD_FOLDER)
+        with ingest_stage("scan"):
+            scanned = self.reader.scan_images(base_folder)
+        INGEST_FILES.inc(len(scanned), stage="scan")
+        return self.manifest.diff(base_folder, scanned)
+
+    def build_incremental(self, folder_path: str | Path | None = None) -> Tuple[pd.DataFrame, ManifestChanges]:
+        """
+        Like build_dataframe(), but only new or changed files (according to
+        the manifest) are opened and parsed.
+
+        Returns:
+          (DataFrame of new + changed files, ManifestChanges)
+
+        Call self.manifest.save() once the rows are in the database.
+        """
+        changes = self.scan_changes(folder_path)
+        df = self._frame_from_paths([Path(p) for p in changes.to_extract])
+        return df, changes
+
+    def iter_batches(
+        self,
+        folder_path: str | Path | None = None,
+        files: Iterable[str | Path] | None = None,
+        batch_size: int | None = None,
+        hashes: Dict[str, str] | None = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Streaming alternative to build_dataframe().
+
+        Walks the folder lazily (or uses the given full paths, e.g.
+        ManifestChanges.to_extract) and yields lists of at most batch_size
+        records, already reduced to the image_info columns:
+          image_filename, exif_datetime, full_path, created_time,
+          exif_make, exif_model, exif_xpkeywords
 
-        for rel in rel_files:
-            full_path = (base_folder / rel).resolve()
-            row: Dict[str, Any] = {
-                "full_path": str(full_path),
-                "created_time": self._file_created_time_iso(full_path),
-            }
+        Only one batch is held in memory at a time.
 
-            exif = self._read_exif_dict(full_path)
-            row.update(exif)  # each EXIF tag becomes a column
+        hashes: {full path: content hash} already computed by the caller
+        (fingerprint.match_moves); those files are not hashed again.
+        """
+        if files is None:
+            base_folder = Path(folder_path) if folder_path else Path(self.config.UPLOAD_FOLDER)
+            files = ((base_folder / rel).resolve() for rel in self.reader.iter_images(base_folder))
 
-            rows.append(row)
+        batch_size = max(1, batch_size or self.config.INGEST_BATCH_SIZE)
+        workers = self._worker_count()
+        pool = self._make_pool(workers) if workers > 1 else None
+
+        try:
+            it = iter(files)
+            while True:
+                chunk = [Path(p) for p in islice(it, batch_size)]
+                if not chunk:
+                    break
+                with ingest_stage("extract", len(chunk)):
+                    rows = self._extract_rows(chunk, pool, hashes)
+                yield [self._to_record(row) for row in rows]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    # -----------------------------
+    # Internal helpers
+    # -----------------------------
+    def _frame_from_paths(self, full_paths: List[Path]) -> pd.DataFrame:
+        with ingest_stage("extract", len(full_paths)):
+            rows = self._extract_rows(full_paths)
 
-        df = pd.DataFrame(rows)
+        df = pd.DataFrame(rows, columns=None if rows else ["full_path", "created_time"])
 
     
 
@@ -59,13 +157,133 @@ class ExifDataFrameBuilder:
         key_cols = ["full_path", "created_time"]
         other_cols = [c for c in df.columns if c not in key_cols]
         df = df[key_cols + sorted(other_cols)]
-        df = df[["full_path","created_time","EXIF_Make","EXIF_Model","EXIF_DateTime","image_filename","EXIF_XPKeywords"]]
+        # reindex: a batch without e.g. any XPKeywords still gets the column
+        df = df.reindex(columns=["full_path","created_time","EXIF_Make","EXIF_Model","EXIF_DateTime","image_filename","EXIF_XPKeywords","phash","content_hash"])
 
         return df
 
     # -----------------------------
     # Internal helpers
     # -----------------------------
+    def _extract_rows(
+        self,
+        full_paths: List[Path],
+        pool: ProcessPoolExecutor | None = None,
+        hashes: Dict[str, str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One row per path, in the same order as full_paths.
+        Uses a process pool when ingest.workers allows it.
+        """
+        chunk_size = max(1, self.config.INGEST_CHUNK_SIZE)
+        digests = [(hashes or {}).get(str(p)) for p in full_paths]
+
+        if pool is None:
+            workers = self._worker_count()
+            # not worth spawning processes for a handful of files
+            if workers <= 1 or len(full_paths) <= chunk_size:
+                return [self._safe_extract_row(p, d) for p, d in zip(full_paths, digests)]
+            with self._make_pool(workers) as pool:
+                return self._extract_rows(full_paths, pool, hashes)
+
+        rows: List[Dict[str, Any]] = []
+        try:
+            # map() yields results in submission order
+            items = [(str(p), d) for p, d in zip(full_paths, digests)]
+            for row in pool.map(_extract_row_worker, items, chunksize=chunk_size):
+                rows.append(row)
+        except BrokenProcessPool:
+            # a worker died hard (e.g. a decoder crash) -> finish serially
+            rows.extend(self._safe_extract_row(p, d) for p, d in zip(full_paths[len(rows):], digests[len(rows):]))
+
+        return rows
+
+    def _worker_count(self) -> int:
+        return self.config.INGEST_WORKERS or os.cpu_count() or 1
+
+    def _make_pool(self, workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.config,),
+        )
+
+    def _to_record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Extracted row -> image_info column names."""
+        return {
+            "image_filename": Path(row["full_path"]).name,
+            "exif_datetime": row.get("EXIF_DateTime"),
+            "full_path": row["full_path"],
+            "created_time": row.get("created_time"),
+            "exif_make": row.get("EXIF_Make"),
+            "exif_model": row.get("EXIF_Model"),
+            "exif_xpkeywords": row.get("EXIF_XPKeywords"),
+            "phash": row.get("phash"),
+            "content_hash": row.get("content_hash"),
+            "exif_extra": self._extra_tags(row) if self.config.EXIF_STORE else None,
+        }
+
+    def _safe_extract_row(self, full_path: Path, digest: str | None = None) -> Dict[str, Any]:
+        """
+        _extract_row() for one file of a batch, serial or in a worker: a
+        corrupt file (or a decoder bug it triggers) yields a bare row
+        instead of taking the whole batch down.
+        """
+        try:
+            return self._extract_row(full_path, digest)
+        except Exception:
+            log.warning("extract failed: %s", full_path, exc_info=True)
+            return {"full_path": str(full_path), "created_time": None}
+
+    def _extract_row(self, full_path: Path, digest: str | None = None) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"full_path": str(full_path)}
+        try:
+            row["created_time"] = self._file_created_time_iso(full_path)
+        except OSError:
+            # file vanished between scan and extract
+            row["created_time"] = None
+            return row
+
+        # digest: already hashed by the move detection of this sync
+        row["content_hash"] = digest or content_hash(full_path, self.config.CONTENT_HASH_SAMPLE)
+        if full_path.suffix.lower().lstrip(".") in self.config.VIDEO_EXTENSIONS:
+            # header boxes only; the media data is never read
+            meta = read_video_meta(full_path) or {}
+            row.update((f"EXIF_{k}", v) for k, v in meta.items())
+            return row
+
+        exif = self._read_exif_dict(full_path)
+        row.update(exif)  # each EXIF tag becomes a column
+
+        if self.config.PHASH_ENABLED:
+            value = dhash(full_path)
+            row["phash"] = to_hex(value) if value is not None else None
+        return row
+
+    def _profile_tags(self, profile: str) -> Set[int]:
+        profiles = {**EXIF_PROFILES, **{k: tuple(v or ()) for k, v in self.config.EXIF_PROFILES.items()}}
+        if profile not in profiles:
+            raise ValueError(f"unknown exif.profile {profile!r} (expected one of {', '.join(profiles)})")
+
+        names = profiles[profile]
+        if names is None:
+            return {tag_id for tag_id, name in self._exif_tag_map.items() if name not in _SKIPPED_TAGS}
+
+        by_name = {name: tag_id for tag_id, name in self._exif_tag_map.items()}
+        wanted = {by_name[name] for name in CORE_TAGS + names if name in by_name}
+        unknown = [name for name in names if name not in by_name]
+        if unknown:
+            log.warning("EXIF profile %r: unknown tags ignored: %s", profile, ", ".join(unknown))
+        return wanted
+
+    def _extra_tags(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Parsed tags beyond the image_info columns ({TagName: value}), None if there are none."""
+        extra = {
+            col[5:]: value for col, value in row.items()
+            if col.startswith("EXIF_") and col[5:] not in CORE_TAGS and value is not None
+        }
+        return extra or None
+
     def _file_created_time_iso(self, path: Path) -> str:
         """
         Windows: st_ctime is creation time.
@@ -79,42 +297,67 @@ class ExifDataFrameBuilder:
         """
         Returns EXIF tags as { "EXIF_<TagName>": value }.
         If no EXIF or not readable, returns {}.
+
+        JPEG/HEIC are parsed from the file header (exifheader.read_exif);
+        anything else falls back to Pillow.
         """
+        exif_raw = read_exif(path, self._wanted_tags)
+        if exif_raw is None:
+            exif_raw = self._read_exif_pillow(path)
+        if not exif_raw:
+            return {}
+
+        out: Dict[str, Any] = {}
+        for tag_id, value in exif_raw.items():
+            tag_name = self._exif_tag_map.get(tag_id, str(tag_id))
+            col = f"EXIF_{tag_name}"
+
+            out[col] = self._normalize_exif_value(value, tag_name)
+
+        return out
+
+    def _read_exif_pillow(self, path: Path) -> Dict[int, Any]:
         try:
             with Image.open(path) as im:
                 exif_raw = im.getexif()
                 #print("tets run",exif_raw)
-                if not exif_raw:
-                    return {}
-
-                out: Dict[str, Any] = {}
-                for tag_id, value in exif_raw.items():
-                    tag_name = self._exif_tag_map.get(tag_id, str(tag_id))
-                    col = f"EXIF_{tag_name}"
-
-                    out[col] = self._normalize_exif_value(value)
-                    print("\t\t--",tag_name,"\t---> ", out[col])
-
+                out = {k: v for k, v in exif_raw.items() if k in self._wanted_tags}
+                if self._wanted_tags - out.keys():
+                    # camera settings live in the Exif sub-IFD
+                    out.update((k, v) for k, v in exif_raw.get_ifd(EXIF_IFD_POINTER).items()
+                               if k in self._wanted_tags and k not in out)
                 return out
 
         except Exception:
             # Some images (png/gif/heic) may have no EXIF or Pillow may not read it.
             return {}
 
-    def _normalize_exif_value(self, value: Any) -> Any:
+    def _normalize_exif_value(self, value: Any, tag_name: str = "") -> Any:
         """
-        Make EXIF values safe for DataFrame + DB insertion.
+        Make EXIF values safe for DataFrame + DB insertion (and JSON,
+        for the image_exif store).
         """
         # bytes -> decode if possible
         if isinstance(value, (bytes, bytearray)):
-            try:
-                return value.decode("utf-16le", errors="replace")
-            except Exception:
-                return str(value)
+            if tag_name.startswith("XP") or not tag_name:
+                # Windows XP* tags are UTF-16
+                try:
+                    return value.decode("utf-16le", errors="replace")
+                except Exception:
+                    return str(value)
+            text = value.rstrip(b"\0")
+            # UNDEFINED: often ASCII ("0232"), otherwise keep it as hex
+            return text.decode("ascii") if text.isascii() and text.decode("ascii").isprintable() else value.hex()
 
-        # Pillow IFDRational / tuples -> stringify to keep DB-friendly
+        # Pillow IFDRational -> float
+        if hasattr(value, "numerator") and hasattr(value, "denominator") and not isinstance(value, int):
+            value = float(value) if value.denominator else float("nan")
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+
+        # tuples -> lists (only the CORE_TAGS reach image_info columns, as scalars)
         if isinstance(value, (tuple, list)):
-            return str(value)
+            return [self._normalize_exif_value(v, tag_name) for v in value]
 
         # dict-like -> stringify
         if isinstance(value, dict):
@@ -122,6 +365,22 @@ class ExifDataFrameBuilder:
 
         return value
 
+# -----------------------------
+# Process-pool workers
+# -----------------------------
+_worker_builder: ExifDataFrameBuilder | None = None
+
+
+def _init_worker(config: Config) -> None:
+    global _worker_builder
+    _worker_builder = ExifDataFrameBuilder(config)
+
+
+def _extract_row_worker(item: Tuple[str, Optional[str]]) -> Dict[str, Any]:
+    full_path, digest = item
+    return _worker_builder._safe_extract_row(Path(full_path), digest)
+
+
 if __name__ == "__main__":
     cfg = Config("config.yaml")
     builder = ExifDataFrameBuilder(cfg)
@@ -0,0 +1,132 @@
+# fingerprint.py
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Content identity of a file, independent of its path, so a folder moved
+# or renamed inside the upload folder is recognised as the same images
+# (path update only) instead of new ones (re-extract + orphaned rows).
+#
+# Photos are never edited in place by this app and two different photos
+# practically never share size, first and last 64 KiB, so by default only
+# those are hashed: two small reads per file whatever its size.
+# sample_bytes=0 hashes the whole file (streamed).
+
+DEFAULT_SAMPLE = 64 * 1024
+_CHUNK = 1024 * 1024
+
+
+def content_hash(path: str | Path, sample_bytes: int = DEFAULT_SAMPLE) -> Optional[str]:
+    """
+    blake2b-128 hex of size + head + tail (or of the whole file when it is
+    small or sample_bytes is 0). None if the file cannot be read.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            h.update(size.to_bytes(8, "little"))
+            if sample_bytes and size > 2 * sample_bytes:
+                h.update(f.read(sample_bytes))
+                f.seek(size - sample_bytes)
+                h.update(f.read(sample_bytes))
+            else:
+                while chunk := f.read(_CHUNK):
+                    h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def match_moves(
+    db,
+    appeared: Iterable[str],
+    gone: Iterable[str],
+    sample_bytes: int = DEFAULT_SAMPLE,
+    hashes: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """
+    Pair files that disappeared from the folder with files that appeared
+    and have the same content hash. Returns {old full_path: new full_path}.
+
+    Only runs when both sides are non-empty (a plain copy-in or delete
+    costs nothing). Among several candidates with the same content, one
+    with the same file name is preferred.
+
+    hashes, if given, receives {appeared path: content hash} for every
+    file hashed here, so the extraction that follows
+    (ExifDataFrameBuilder.iter_batches(hashes=...)) doesn't read them again.
+    """
+    gone = list(gone)
+    appeared = list(appeared)
+    if not gone or not appeared:
+        return {}
+
+    by_hash: Dict[str, List[str]] = {}
+    for path, value in db.get_content_hashes(gone).items():
+        by_hash.setdefault(value, []).append(path)
+    if not by_hash:
+        return {}   # rows stored before content hashes existed
+
+    moves: Dict[str, str] = {}
+    for new_path in appeared:
+        value = content_hash(new_path, sample_bytes)
+        if hashes is not None and value is not None:
+            hashes[new_path] = value
+        olds = by_hash.get(value) if value else None
+        if not olds:
+            continue
+        name = Path(new_path).name
+        old = next((p for p in olds if Path(p).name == name), olds[0])
+        olds.remove(old)
+        moves[old] = new_path
+    return moves
+
+
+def apply_moves(
+    db,
+    appeared: Iterable[str],
+    gone: Iterable[str],
+    sample_bytes: int = DEFAULT_SAMPLE,
+    hashes: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """match_moves() + ImageDBService.move_images(). Returns the moves applied."""
+    moves = match_moves(db, appeared, gone, sample_bytes, hashes)
+    return db.move_images(moves) if moves else {}
+
+
+def backfill(db, sample_bytes: int = DEFAULT_SAMPLE, batch_size: int = 500) -> int:
+    """Hash rows stored before content hashes existed. Returns rows updated."""
+    done = 0
+    after: Optional[str] = None   # keyset: unreadable files stay NULL and are passed over
+    while True:
+        paths = db.get_paths_missing("content_hash", after, batch_size)
+        if not paths:
+            return done
+        after = paths[-1]
+        hashes = {p: v for p in paths if (v := content_hash(p, sample_bytes)) is not None}
+        done += db.update_hashes("content_hash", hashes)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import Config
+    from database import ImageDBService
+
+    parser = argparse.ArgumentParser(description="Content fingerprints for move/rename detection.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="hash images stored without a content hash")
+    one = sub.add_parser("hash", help="print the content hash of files")
+    one.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    cfg = Config("config.yaml")
+    if args.cmd == "backfill":
+        print("hashed:", backfill(ImageDBService(cfg), cfg.CONTENT_HASH_SAMPLE))
+    else:
+        for p in args.paths:
+            print(content_hash(p, cfg.CONTENT_HASH_SAMPLE), p)
@@ -0,0 +1,177 @@
+# manifest.py
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from config import Config
+
+
+@dataclass
+class ManifestChanges:
+    """
+    Result of comparing a folder scan against the stored manifest.
+    All paths are resolved full paths (same form as image_info.full_path).
+    """
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    moved: Dict[str, str] = field(default_factory=dict)   # old full path -> new
+
+    @property
+    def to_extract(self) -> List[str]:
+        return self.new + self.changed
+
+    def mark_moved(self, moves: Dict[str, str]) -> None:
+        """Take moved files out of new/deleted: their rows only need a path update."""
+        if not moves:
+            return
+        self.moved.update(moves)
+        old, new = set(moves), set(moves.values())
+        self.deleted = [p for p in self.deleted if p not in old]
+        self.new = [p for p in self.new if p not in new]
+
+
+class FileManifest:
+    """
+    Persistent record of every file seen by the last scan.
+
+    On disk (JSON):
+        {
+          "base": "<resolved upload folder>",
+          "files": { "<relpath>": [size, mtime_ns, inode, "<full_path>"] }
+        }
+
+    diff() stages the new state, save() writes it. Callers should only
+    save() once the changes have reached the database, so a failed sync
+    is simply retried on the next run.
+    """
+
+    def __init__(self, config: Config | None = None, manifest_path: str | Path | None = None):
+        self.config = config or Config()
+        self.path = Path(manifest_path or self.config.MANIFEST_FILE)
+        self._loaded: Dict[str, Any] | None = None
+        self._pending: Dict[str, Any] | None = None
+
+    @property
+    def _data(self) -> Dict[str, Any]:
+        # loaded on first use; worker processes never touch it
+        if self._loaded is None:
+            self._loaded = self._load()
+        return self._loaded
+
+    @property
+    def dirty(self) -> bool:
+        """True when diff()/update() staged changes that save() hasn't written."""
+        return self._pending is not None
+
+    def diff(self, base_folder: str | Path, scanned: List[Tuple[str, os.stat_result]]) -> ManifestChanges:
+        """
+        Compare (relpath, stat) pairs from FileReader.scan_images() with the
+        manifest. A file counts as changed when size, mtime or inode differ.
+        """
+        base = Path(base_folder).resolve()
+        known: Dict[str, list] = self._data["files"] if self._data.get("base") == str(base) else {}
+
+        changes = ManifestChanges()
+        files: Dict[str, list] = {}
+
+        for rel, st in scanned:
+            prev = known.get(rel)
+            sig = [st.st_size, st.st_mtime_ns, st.st_ino]
+
+            if prev is not None and prev[:3] == sig:
+                files[rel] = prev
+                changes.unchanged += 1
+                continue
+
+            full_path = str((base / rel).resolve())
+            files[rel] = sig + [full_path]
+            if prev is None:
+                changes.new.append(full_path)
+            else:
+                changes.changed.append(full_path)
+
+        for rel, entry in known.items():
+            if rel not in files:
+                changes.deleted.append(entry[3])
+
+        self._pending = {"base": str(base), "files": files}
+        return changes
+
+    def update(self, base_folder: str | Path, stats: Dict[str, os.stat_result | None]) -> None:
+        """
+        Patch individual entries (relpath -> stat, None = deleted) without
+        a full scan, e.g. from filesystem events. Staged like diff();
+        call save() to persist. No-op until a first diff() has set the base.
+        """
+        base = Path(base_folder).resolve()
+        data = self._pending if self._pending is not None else self._data
+        if data.get("base") != str(base):
+            return
+
+        files = dict(data["files"])
+        for rel, st in stats.items():
+            if st is None:
+                files.pop(rel, None)
+            else:
+                files[rel] = [st.st_size, st.st_mtime_ns, st.st_ino, str((base / rel).resolve())]
+        self._pending = {"base": str(base), "files": files}
+        # later diff()/update() calls build on this state even before save()
+        self._loaded = self._pending
+
+    def paths_under(self, rel_dir: str) -> List[str]:
+        """Full paths of known files below a relative directory."""
+        prefix = rel_dir.rstrip("/\\") + os.sep
+        return [entry[3] for rel, entry in self._data["files"].items() if rel.startswith(prefix)]
+
+    def save(self) -> None:
+        """Persist the state staged by the last diff() (atomic replace)."""
+        if self._pending is None:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._pending, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+        self._loaded = self._pending
+        self._pending = None
+
+    def clear(self) -> None:
+        """Forget everything; the next diff() reports every file as new."""
+        self._loaded = {"base": None, "files": {}}
+        self._pending = None
+        if self.path.exists():
+            self.path.unlink()
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {"base": None, "files": {}}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # corrupt/partial manifest -> behave like a first run
+            return {"base": None, "files": {}}
+        if not isinstance(data, dict) or not isinstance(data.get("files"), dict):
+            return {"base": None, "files": {}}
+        return data
+
+
+if __name__ == "__main__":
+    from reader import FileReader
+
+    config = Config("config.yaml")
+    manifest = FileManifest(config)
+    changes = manifest.diff(config.UPLOAD_FOLDER, FileReader(config).scan_images(config.UPLOAD_FOLDER))
+    print(f"new={len(changes.new)} changed={len(changes.changed)} "
+          f"deleted={len(changes.deleted)} unchanged={changes.unchanged}")
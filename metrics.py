@@ -0,0 +1,274 @@
+# metrics.py
+from __future__ import annotations
+
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# In-process counters and latency histograms, rendered in the Prometheus
+# text format by web.py's /metrics route. No client library needed.
+#
+# Values are per process: with several web workers, scrape each one (or
+# run a single worker).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[Any, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(tuple(labels.get(n, "") for n in self.labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), state[:-1]):
+                    cumulative += n
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(state[-1])}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named metrics of this process; counter()/histogram() return the existing one if registered."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Counter | Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help, labels)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, labels, buckets)
+            return self._metrics[name]
+
+    def add_collector(self, collect: Callable[[], Iterable[str]]) -> None:
+        """collect() returns extra exposition lines, computed at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        for collect in list(self._collectors):
+            lines += list(collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "gallery_ingest_stage_seconds", "Time spent per ingest stage call.", ["stage"])
+INGEST_FILES = REGISTRY.counter(
+    "gallery_ingest_files_total", "Files handled per ingest stage.", ["stage"])
+DB_METHOD_SECONDS = REGISTRY.histogram(
+    "gallery_db_method_seconds", "ImageDBService method latency.", ["method"])
+DB_METHOD_ERRORS = REGISTRY.counter(
+    "gallery_db_method_errors_total", "ImageDBService calls that raised.", ["method"])
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "gallery_db_query_seconds", "SQL statement latency by statement type.", ["statement"])
+DB_SLOW_QUERIES = REGISTRY.counter(
+    "gallery_db_slow_queries_total", "SQL statements slower than metrics.slow_query_ms.", ["statement"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "gallery_http_request_seconds", "Flask request latency by route.", ["route", "method", "status"])
+
+
+# -----------------------------
+# Instrumentation helpers
+# -----------------------------
+@contextmanager
+def ingest_stage(stage: str, files: int = 0) -> Iterator[None]:
+    """Time one call of an ingest stage (scan, extract, upsert, thumbnails ...)."""
+    with INGEST_STAGE_SECONDS.time(stage=stage):
+        yield
+    if files:
+        INGEST_FILES.inc(files, stage=stage)
+
+
+def db_method(fn: Callable) -> Callable:
+    """Decorator: latency and error count of an ImageDBService method."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            DB_METHOD_ERRORS.inc(method=name)
+            raise
+        finally:
+            DB_METHOD_SECONDS.observe(time.perf_counter() - t0, method=name)
+
+    return wrapper
+
+
+_WS = re.compile(r"\s+")
+_ROW_GROUPS = re.compile(r"(\((?:%s, )*%s\))(?:, \1)+")
+_MARK_LIST = re.compile(r"%s(?:, %s){3,}")
+
+
+def _shorten(sql: str, limit: int = 500) -> str:
+    """One line, with multi-row VALUES and long IN (...) lists collapsed."""
+    text = _WS.sub(" ", sql).strip()
+    text = _ROW_GROUPS.sub(lambda m: f"{m.group(1)} x{m.group(0).count(m.group(1))}", text)
+    text = _MARK_LIST.sub(lambda m: f"%s x{m.group(0).count('%s')}", text)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _statement(sql: str) -> str:
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else ""
+
+
+class _TimedCursor:
+    """DB-API cursor proxy timing execute()/executemany()."""
+
+    def __init__(self, cursor, slow_seconds: float | None):
+        self._cursor = cursor
+        self._slow = slow_seconds
+
+    def _run(self, method: Callable, sql: str, params: Any, rows: int | None = None):
+        t0 = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - t0
+            statement = _statement(sql)
+            DB_QUERY_SECONDS.observe(elapsed, statement=statement)
+            if self._slow is not None and elapsed >= self._slow:
+                DB_SLOW_QUERIES.inc(statement=statement)
+                text = _shorten(sql)
+                extra = f" rows={rows}" if rows is not None else ""
+                log.warning("slow query: %.1f ms%s: %s", elapsed * 1000, extra, text)
+
+    def execute(self, sql: str, params: Any = ()):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql: str, seq_of_params: Any):
+        seq_of_params = list(seq_of_params)
+        return self._run(self._cursor.executemany, sql, seq_of_params, rows=len(seq_of_params))
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """
+    Connection proxy whose cursors record gallery_db_query_seconds and
+    log statements slower than slow_ms as warnings (None = no slow log).
+    """
+
+    def __init__(self, conn, slow_ms: float | None = None):
+        self._raw = conn
+        self._slow = slow_ms / 1000.0 if slow_ms else None
+
+    def cursor(self, *args, **kwargs) -> _TimedCursor:
+        return _TimedCursor(self._raw.cursor(*args, **kwargs), self._slow)
+
+    def __getattr__(self, name: str):
+        return getattr(self._raw, name)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+if __name__ == "__main__":
+    with ingest_stage("demo", files=3):
+        time.sleep(0.01)
+    print(render())
@@ -0,0 +1,398 @@
+# migrations.py
+from __future__ import annotations
+
+import re
+from datetime import datetime
+from typing import Any, Callable, List, Tuple
+
+from tagmanager import split_tags
+
+# Schema changes ImageDBService relies on, applied in order and recorded
+# in schema_version. Every step checks before it changes anything, so it
+# is safe on databases that were set up by hand or by older versions.
+#
+# To change the schema: append a new (version, description, function)
+# entry. Never edit or reorder one that has shipped. SQLite databases
+# (database.type: sqlite) follow SQLITE_MIGRATIONS, which must keep the
+# same version numbers.
+
+
+# -----------------------------
+# Introspection helpers
+# -----------------------------
+def _has_table(cursor, table: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _has_column(cursor, table: str, column: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _has_index_on(cursor, table: str, first_column: str, unique: bool = False) -> bool:
+    """True if some index (unique if asked) starts with first_column."""
+    sql = (
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s "
+        "AND column_name = %s AND seq_in_index = 1"
+    )
+    if unique:
+        sql += " AND non_unique = 0"
+    cursor.execute(sql, (table, first_column))
+    return cursor.fetchone()[0] > 0
+
+
+# -----------------------------
+# Migrations
+# -----------------------------
+def m001_image_info(db, conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {db.table} (
+        id              BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        image_filename  VARCHAR(255),
+        exif_datetime   DATETIME NULL,
+        full_path       VARCHAR(768) NOT NULL,
+        created_time    DATETIME NULL,
+        exif_make       VARCHAR(128),
+        exif_model      VARCHAR(128),
+        exif_xpkeywords TEXT
+    )
+    """)
+
+
+def m002_unique_full_path(db, conn) -> None:
+    cursor = conn.cursor()
+    if not _has_index_on(cursor, db.table, "full_path", unique=True):
+        cursor.execute(f"ALTER TABLE {db.table} ADD UNIQUE INDEX ux_{db.table}_full_path (full_path)")
+
+
+def m003_image_tags(db, conn) -> None:
+    cursor = conn.cursor()
+    if not _has_column(cursor, db.table, "id"):
+        cursor.execute(
+            f"ALTER TABLE {db.table} "
+            f"ADD COLUMN id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE FIRST"
+        )
+    if _has_table(cursor, "image_tags"):
+        return
+
+    cursor.execute("""
+    CREATE TABLE image_tags (
+        image_id BIGINT UNSIGNED NOT NULL,
+        tag      VARCHAR(191) NOT NULL,
+        PRIMARY KEY (image_id, tag),
+        KEY ix_image_tags_tag (tag, image_id)
+    )
+    """)
+
+    # backfill from the comma separated strings, 1000 rows at a time
+    last_id = 0
+    while True:
+        cursor.execute(
+            f"SELECT id, exif_xpkeywords FROM {db.table} "
+            f"WHERE id > %s AND exif_xpkeywords IS NOT NULL "
+            f"ORDER BY id LIMIT 1000",
+            (last_id,),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        pairs = [(image_id, tag) for image_id, kw in rows for tag in split_tags(kw)]
+        if pairs:
+            cursor.executemany("INSERT IGNORE INTO image_tags (image_id, tag) VALUES (%s, %s)", pairs)
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def m004_query_indexes(db, conn) -> None:
+    cursor = conn.cursor()
+    # date filters + gallery order/keyset: (exif_datetime, full_path)
+    if not _has_index_on(cursor, db.table, "exif_datetime"):
+        cursor.execute(f"CREATE INDEX ix_{db.table}_datetime_path ON {db.table} (exif_datetime, full_path)")
+    if not _has_index_on(cursor, db.table, "image_filename"):
+        cursor.execute(f"CREATE INDEX ix_{db.table}_filename ON {db.table} (image_filename)")
+
+
+def m005_phash(db, conn) -> None:
+    cursor = conn.cursor()
+    # 64-bit dHash as 16 hex chars (phash.py)
+    if not _has_column(cursor, db.table, "phash"):
+        cursor.execute(f"ALTER TABLE {db.table} ADD COLUMN phash CHAR(16) NULL")
+
+
+def m006_content_hash(db, conn) -> None:
+    cursor = conn.cursor()
+    # fingerprint.content_hash: finds a moved/renamed file's existing row
+    if not _has_column(cursor, db.table, "content_hash"):
+        cursor.execute(f"ALTER TABLE {db.table} ADD COLUMN content_hash CHAR(32) NULL")
+    if not _has_index_on(cursor, db.table, "content_hash"):
+        cursor.execute(f"CREATE INDEX ix_{db.table}_content_hash ON {db.table} (content_hash)")
+
+
+def m007_image_exif(db, conn) -> None:
+    cursor = conn.cursor()
+    # exif.store: tags beyond the image_info columns, one JSON object per
+    # image, plus the commonly filtered ones as typed, indexed columns
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS image_exif (
+        image_id      BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+        data          TEXT NOT NULL,
+        orientation   SMALLINT NULL,
+        iso           INT NULL,
+        f_number      FLOAT NULL,
+        exposure_time FLOAT NULL,
+        focal_length  FLOAT NULL,
+        lens_model    VARCHAR(128) NULL,
+        KEY ix_image_exif_iso (iso),
+        KEY ix_image_exif_focal_length (focal_length),
+        KEY ix_image_exif_lens_model (lens_model)
+    )
+    """)
+
+
+def m008_nocase_text(db, conn) -> None:
+    # full_path, exif_make and exif_model already compare case-insensitively
+    # under MySQL's default collation; the step exists for SQLite (s008)
+    return None
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Any, Any], None]]] = [
+    (1, "create image_info", m001_image_info),
+    (2, "unique index on full_path", m002_unique_full_path),
+    (3, "image_tags index", m003_image_tags),
+    (4, "indexes for date, order and filename queries", m004_query_indexes),
+    (5, "perceptual hash column", m005_phash),
+    (6, "content hash column", m006_content_hash),
+    (7, "image_exif side table", m007_image_exif),
+    (8, "case-insensitive paths and camera names", m008_nocase_text),
+]
+
+
+# -----------------------------
+# SQLite
+# -----------------------------
+# Same schema in SQLite terms. DDL is transactional here, so each step
+# runs inside the migration's write transaction.
+def _sqlite_has_column(cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def s001_image_info(db, conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {db.table} (
+        id              INTEGER PRIMARY KEY,
+        image_filename  TEXT COLLATE NOCASE,
+        exif_datetime   DATETIME NULL,
+        full_path       TEXT NOT NULL,
+        created_time    DATETIME NULL,
+        exif_make       TEXT,
+        exif_model      TEXT,
+        exif_xpkeywords TEXT
+    )
+    """)
+
+
+def s002_unique_full_path(db, conn) -> None:
+    conn.cursor().execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{db.table}_full_path ON {db.table} (full_path)"
+    )
+
+
+def s003_image_tags(db, conn) -> None:
+    cursor = conn.cursor()
+    # tags compare case-insensitively, as under MySQL's collation
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS image_tags (
+        image_id INTEGER NOT NULL,
+        tag      TEXT COLLATE NOCASE NOT NULL,
+        PRIMARY KEY (image_id, tag)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_image_tags_tag ON image_tags (tag, image_id)")
+    cursor.execute(f"SELECT id, exif_xpkeywords FROM {db.table} WHERE exif_xpkeywords IS NOT NULL")
+    pairs = [(image_id, tag) for image_id, kw in cursor.fetchall() for tag in split_tags(kw)]
+    if pairs:
+        cursor.executemany("INSERT OR IGNORE INTO image_tags (image_id, tag) VALUES (%s, %s)", pairs)
+
+
+def s004_query_indexes(db, conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS ix_{db.table}_datetime_path ON {db.table} (exif_datetime, full_path)"
+    )
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{db.table}_filename ON {db.table} (image_filename)")
+
+
+def s005_phash(db, conn) -> None:
+    cursor = conn.cursor()
+    if not _sqlite_has_column(cursor, db.table, "phash"):
+        cursor.execute(f"ALTER TABLE {db.table} ADD COLUMN phash CHAR(16) NULL")
+
+
+def s006_content_hash(db, conn) -> None:
+    cursor = conn.cursor()
+    if not _sqlite_has_column(cursor, db.table, "content_hash"):
+        cursor.execute(f"ALTER TABLE {db.table} ADD COLUMN content_hash CHAR(32) NULL")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{db.table}_content_hash ON {db.table} (content_hash)")
+
+
+def s007_image_exif(db, conn) -> None:
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS image_exif (
+        image_id      INTEGER PRIMARY KEY,
+        data          TEXT NOT NULL,
+        orientation   INTEGER NULL,
+        iso           INTEGER NULL,
+        f_number      REAL NULL,
+        exposure_time REAL NULL,
+        focal_length  REAL NULL,
+        lens_model    TEXT COLLATE NOCASE NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_image_exif_iso ON image_exif (iso)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_image_exif_focal_length ON image_exif (focal_length)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_image_exif_lens_model ON image_exif (lens_model)")
+
+
+def s008_nocase_text(db, conn) -> None:
+    """
+    Rebuild image_info with full_path, exif_make and exif_model as
+    COLLATE NOCASE, so lookups by path and the make/model filters match
+    like under MySQL (and like the lowercased "path:" cache keys).
+    SQLite cannot change a column's collation in place.
+
+    Rows whose paths differ only in case would collide on the unique
+    index: the newest (highest id) is kept, with its tags and EXIF.
+    """
+    t = db.table
+    cursor = conn.cursor()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", (t,))
+    row = cursor.fetchone()
+    if row is None or re.search(r"full_path\s+TEXT\s+COLLATE\s+NOCASE", row[0], re.IGNORECASE):
+        return
+
+    dupes = (f"SELECT id FROM {t} a WHERE EXISTS "
+             f"(SELECT 1 FROM {t} b WHERE b.full_path = a.full_path COLLATE NOCASE AND b.id > a.id)")
+    for side in ("image_tags", "image_exif"):
+        cursor.execute(f"DELETE FROM {side} WHERE image_id IN ({dupes})")
+    cursor.execute(f"DELETE FROM {t} WHERE id IN ({dupes})")
+
+    columns = ("id, image_filename, exif_datetime, full_path, created_time, "
+               "exif_make, exif_model, exif_xpkeywords, phash, content_hash")
+    cursor.execute(f"""
+    CREATE TABLE {t}_nocase (
+        id              INTEGER PRIMARY KEY,
+        image_filename  TEXT COLLATE NOCASE,
+        exif_datetime   DATETIME NULL,
+        full_path       TEXT COLLATE NOCASE NOT NULL,
+        created_time    DATETIME NULL,
+        exif_make       TEXT COLLATE NOCASE,
+        exif_model      TEXT COLLATE NOCASE,
+        exif_xpkeywords TEXT,
+        phash           CHAR(16) NULL,
+        content_hash    CHAR(32) NULL
+    )
+    """)
+    cursor.execute(f"INSERT INTO {t}_nocase ({columns}) SELECT {columns} FROM {t}")
+    cursor.execute(f"DROP TABLE {t}")
+    cursor.execute(f"ALTER TABLE {t}_nocase RENAME TO {t}")
+
+    # the indexes went with the old table
+    s002_unique_full_path(db, conn)
+    s004_query_indexes(db, conn)
+    s006_content_hash(db, conn)
+
+
+SQLITE_MIGRATIONS: List[Tuple[int, str, Callable[[Any, Any], None]]] = [
+    (1, "create image_info", s001_image_info),
+    (2, "unique index on full_path", s002_unique_full_path),
+    (3, "image_tags index", s003_image_tags),
+    (4, "indexes for date, order and filename queries", s004_query_indexes),
+    (5, "perceptual hash column", s005_phash),
+    (6, "content hash column", s006_content_hash),
+    (7, "image_exif side table", s007_image_exif),
+    (8, "case-insensitive paths and camera names", s008_nocase_text),
+]
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def migrate(db, conn) -> List[int]:
+    """
+    Apply every migration newer than the recorded schema version.
+    A named lock (MySQL) or the write lock (SQLite) keeps several web
+    workers from migrating at once.
+
+    Returns:
+      versions applied by this call
+    """
+    sqlite = db.backend.name == "sqlite"
+    cursor = conn.cursor()
+    if sqlite:
+        conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+    else:
+        cursor.execute("SELECT GET_LOCK('image_db_migrate', 60)")
+        cursor.fetchone()
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at  DATETIME
+        )
+        """)
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cursor.fetchone()[0]
+
+        applied: List[int] = []
+        for version, description, step in (SQLITE_MIGRATIONS if sqlite else MIGRATIONS):
+            if version <= current:
+                continue
+            step(db, conn)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)",
+                (version, description, datetime.now()),
+            )
+            if not sqlite:
+                conn.commit()
+            applied.append(version)
+        if sqlite:
+            conn.commit()
+            cursor.execute("PRAGMA optimize")
+        return applied
+    finally:
+        if sqlite:
+            conn.rollback()   # no-op after commit; releases the lock on error
+        else:
+            cursor.execute("SELECT RELEASE_LOCK('image_db_migrate')")
+            cursor.fetchone()
+
+
+if __name__ == "__main__":
+    from config import Config
+    from database import ImageDBService
+
+    db = ImageDBService(Config("config.yaml"))
+    conn = db._connect()   # first connect already runs migrate()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, description, applied_at FROM schema_version ORDER BY version")
+        for row in cursor.fetchall():
+            print(row)
+    finally:
+        conn.close()
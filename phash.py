@@ -0,0 +1,282 @@
+# phash.py
+from __future__ import annotations
+
+import functools
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from rowindex import RowIndex
+
+
+@functools.lru_cache(maxsize=None)
+def _pillow():
+    # only hashing needs Pillow; the web side just searches stored hashes
+    from PIL import Image, ImageOps
+    try:
+        # optional: lets Pillow decode HEIC/HEIF
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+    return Image, ImageOps
+
+# 64-bit dHash: the image is shrunk to 9x8 grey pixels and every bit
+# says whether a pixel is brighter than its right-hand neighbour. Burst
+# shots, re-encodes and resized copies land within a few bits of each
+# other; distance = number of differing bits (Hamming).
+
+
+def dhash(path: str | Path, hash_size: int = 8) -> Optional[int]:
+    """
+    dHash of an image file, or None if Pillow cannot decode it (videos,
+    corrupt files, HEIC without pillow_heif).
+
+    JPEGs are decoded at 1/2..1/8 scale (draft mode), so this costs a
+    fraction of a full decode.
+    """
+    Image, ImageOps = _pillow()
+    try:
+        with Image.open(path) as im:
+            im.draft("L", (hash_size * 8, hash_size * 8))
+            im = ImageOps.exif_transpose(im)
+            small = im.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    px = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        base = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (px[base + col] > px[base + col + 1])
+    return value
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def from_hex(text: str) -> int:
+    return int(text, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance.
+
+    Each node keeps every item with exactly its hash, and its children
+    by their distance to it. A search for radius d only descends into
+    children whose distance lies in [dist - d, dist + d] (triangle
+    inequality), so small-radius lookups touch a small part of the tree.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None   # [hash, [items], {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, item: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            dist = hamming(value, node[0])
+            if dist == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [value, [item], {}]
+                return
+            node = child
+
+    def remove(self, value: int, item: Any) -> bool:
+        """
+        Drop one item stored under value. Its node stays in place (empty)
+        as a routing node for the children below it. False if not found.
+        """
+        node = self._root
+        while node is not None:
+            dist = hamming(value, node[0])
+            if dist == 0:
+                if item not in node[1]:
+                    return False
+                node[1].remove(item)
+                self.size -= 1
+                return True
+            node = node[2].get(dist)
+        return False
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """(distance, item) of every item within max_distance, nearest first."""
+        out: List[Tuple[int, Any]] = []
+        if self._root is None:
+            return out
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            dist = hamming(value, node[0])
+            if dist <= max_distance:
+                out.extend((dist, item) for item in node[1])
+            lo, hi = dist - max_distance, dist + max_distance
+            for d, child in node[2].items():
+                if lo <= d <= hi:
+                    stack.append(child)
+        out.sort(key=lambda x: x[0])
+        return out
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class DuplicateIndex(RowIndex):
+    """
+    In-memory BK-tree of every stored phash, built from the database on
+    first use and then patched from ImageDBService.add_write_listener()
+    (see RowIndex): only the rows a write touched are moved in the tree.
+    """
+
+    deps = ("listing", "phash")
+
+    def __init__(self, db, max_distance: int = 6):
+        self.max_distance = max_distance
+        super().__init__(db)
+
+    def near(self, full_path: str, max_distance: int | None = None) -> Optional[List[Tuple[int, str]]]:
+        """
+        (distance, full_path) of the near-duplicates of full_path, nearest
+        first, itself excluded. None if full_path has no hash.
+        """
+        d = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            self._refresh()
+            value = self._hashes.get(full_path)
+            if value is None:
+                return None
+            return [(dist, p) for dist, p in self._tree.search(value, d) if p != full_path]
+
+    def near_hash(self, value: int, max_distance: int | None = None) -> List[Tuple[int, str]]:
+        with self._lock:
+            self._refresh()
+            return self._tree.search(value, self.max_distance if max_distance is None else max_distance)
+
+    def clusters(self, max_distance: int | None = None, min_size: int = 2) -> List[List[str]]:
+        """
+        Groups of images linked by chains of near-duplicate pairs
+        (single linkage), largest first; paths sorted within a group.
+        """
+        d = self.max_distance if max_distance is None else max_distance
+
+        parent: Dict[str, str] = {}
+
+        def find(p: str) -> str:
+            root = p
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while parent.get(p, p) != root:
+                parent[p], p = root, parent[p]
+            return root
+
+        with self._lock:
+            self._refresh()
+            for path, value in self._hashes.items():
+                for _, other in self._tree.search(value, d):
+                    if other != path:
+                        a, b = find(path), find(other)
+                        if a != b:
+                            parent.setdefault(a, a)
+                            parent.setdefault(b, b)
+                            parent[max(a, b)] = min(a, b)
+
+        groups: Dict[str, List[str]] = {}
+        for path in parent:
+            groups.setdefault(find(path), []).append(path)
+        out = [sorted(g) for g in groups.values() if len(g) >= min_size]
+        out.sort(key=lambda g: (-len(g), g[0]))
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._refresh()
+            return {"hashes": len(self._tree), "max_distance": self.max_distance}
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _fetch(self, ids: Optional[Sequence[int]] = None, after_id: int = 0) -> List[Tuple[Any, ...]]:
+        return self.db.get_phash_rows(ids=ids, after_id=after_id)
+
+    def _clear(self) -> None:
+        self._tree = BKTree()
+        self._hashes: Dict[str, int] = {}   # full_path -> phash
+
+    def _add(self, row: Tuple[Any, ...]) -> Tuple[str, Optional[int]]:
+        _, full_path, hex_value = row
+        value = from_hex(hex_value) if hex_value else None
+        if value is not None:
+            self._hashes[full_path] = value
+            self._tree.add(value, full_path)
+        return full_path, value
+
+    def _discard(self, entry: Tuple[str, Optional[int]]) -> None:
+        full_path, value = entry
+        if value is not None:
+            self._tree.remove(value, full_path)
+            if self._hashes.get(full_path) == value:
+                del self._hashes[full_path]
+
+
+def backfill(db, batch_size: int = 500) -> int:
+    """Hash rows stored before phashes existed (phash IS NULL). Returns rows updated."""
+    done = 0
+    after: Optional[str] = None   # keyset: undecodable files stay NULL and are passed over
+    while True:
+        paths = db.get_paths_missing("phash", after, batch_size)
+        if not paths:
+            return done
+        after = paths[-1]
+        hashes = {p: to_hex(v) for p in paths if (v := dhash(p)) is not None}
+        done += db.update_hashes("phash", hashes)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from config import Config
+    from database import ImageDBService
+
+    parser = argparse.ArgumentParser(description="Perceptual-hash duplicates.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("backfill", help="hash images stored without a phash")
+    rep = sub.add_parser("clusters", help="print near-duplicate groups")
+    rep.add_argument("--distance", type=int)
+    rep.add_argument("--min-size", type=int, default=2)
+    near = sub.add_parser("near", help="near-duplicates of one file")
+    near.add_argument("path")
+    near.add_argument("--distance", type=int)
+    args = parser.parse_args()
+
+    cfg = Config("config.yaml")
+    db = ImageDBService(cfg)
+    if args.cmd == "backfill":
+        print("hashed:", backfill(db))
+    else:
+        index = DuplicateIndex(db, cfg.DUPLICATE_DISTANCE)
+        if args.cmd == "clusters":
+            groups = index.clusters(args.distance, args.min_size)
+            for i, group in enumerate(groups, 1):
+                print(f"#{i} ({len(group)} images)")
+                for p in group:
+                    print("   ", p)
+            print(f"{len(groups)} clusters, {sum(len(g) for g in groups)} images")
+        else:
+            matches = index.near(str(Path(args.path).resolve()), args.distance)
+            if matches is None:
+                print("no phash stored for", args.path)
+            for dist, p in matches or []:
+                print(dist, p)
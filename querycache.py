@@ -0,0 +1,112 @@
+# querycache.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Set, Tuple
+
+
+class QueryCache:
+    """
+    In-process result cache for ImageDBService reads.
+
+    Entries expire after ttl seconds and the least recently used one is
+    evicted once max_entries is reached. Each entry is registered under
+    dependency keys (e.g. "listing", "tags", "path:<full_path>") and
+    invalidate() drops exactly the entries registered under a key.
+
+    Results read while an invalidation was in flight are not stored:
+    get() hands out the current version and put() ignores the value if
+    any invalidation happened since.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Set[str]]]" = OrderedDict()
+        self._by_dep: Dict[str, Set[Hashable]] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any, int]:
+        """(hit, value, version token for a following put())."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value, _ = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value, self._version
+                self._drop(key)
+                self.expirations += 1
+            self.misses += 1
+            return False, None, self._version
+
+    def put(self, key: Hashable, value: Any, deps: Iterable[str], token: int) -> None:
+        with self._lock:
+            if token != self._version:
+                return  # a write landed while this value was being read
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+            dep_set = set(deps)
+            self._entries[key] = (time.monotonic() + self.ttl, value, dep_set)
+            for dep in dep_set:
+                self._by_dep.setdefault(dep, set()).add(key)
+
+    def invalidate(self, *deps: str) -> int:
+        """Drop every entry registered under any of deps. Returns count dropped."""
+        with self._lock:
+            self._version += 1
+            keys: Set[Hashable] = set()
+            for dep in deps:
+                keys |= self._by_dep.get(dep, set())
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._by_dep.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for dep in entry[2]:
+            keys = self._by_dep.get(dep)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_dep[dep]
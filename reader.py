@@ -1,6 +1,8 @@
 # reader.py
+import os
+import stat
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
 
 from config import Config
 
@@ -12,7 +14,7 @@ class FileReader:
         self.allowed_extensions = {
             ext.lower().lstrip(".")
             for ext in self.config.ALLOWED_EXTENSIONS
-        }
+        } | self.config.VIDEO_EXTENSIONS
 
     def read_images(self, folder_path: str | Path) -> List[str]:
         """
@@ -37,6 +39,57 @@ class FileReader:
 
         return sorted(images)
 
+    def iter_images(self, folder_path: str | Path) -> Iterator[str]:
+        """
+        Lazy version of read_images(): yields relative paths one directory
+        at a time instead of building (and sorting) the whole list.
+        Order is deterministic (directories and files sorted per level).
+        """
+        folder = Path(folder_path)
+
+        if not folder.exists():
+            raise FileNotFoundError(f"Folder does not exist: {folder}")
+
+        if not folder.is_dir():
+            raise NotADirectoryError(f"Not a directory: {folder}")
+
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                file = Path(root, name)
+                if self._is_allowed(file):
+                    yield str(file.relative_to(folder))
+
+    def scan_images(self, folder_path: str | Path) -> List[Tuple[str, os.stat_result]]:
+        """
+        Same walk as read_images(), but also returns the stat of every file
+        so callers can compare size/mtime/inode without a second stat.
+
+        Returns:
+            List of (relative path, os.stat_result), sorted by path
+        """
+        folder = Path(folder_path)
+
+        if not folder.exists():
+            raise FileNotFoundError(f"Folder does not exist: {folder}")
+
+        if not folder.is_dir():
+            raise NotADirectoryError(f"Not a directory: {folder}")
+
+        images: List[Tuple[str, os.stat_result]] = []
+
+        for file in folder.rglob("*"):
+            if not self._is_allowed(file):
+                continue
+            try:
+                st = file.stat()
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                images.append((str(file.relative_to(folder)), st))
+
+        return sorted(images, key=lambda item: item[0])
+
     # -------------------
     # Internal helpers
     # -------------------
@@ -0,0 +1,189 @@
+# rowindex.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from database import _path_dep
+
+log = logging.getLogger(__name__)
+
+# Shared plumbing of the in-memory indexes over image_info (FacetIndex,
+# DuplicateIndex). The index is built once from the database, then kept
+# current from the write listener: every write names the rows it touched
+# ("path:<full_path>" deps), and only those rows are re-read, plus any
+# rows with an id above the highest one seen (inserts). A write naming
+# no rows makes the next read rebuild from scratch.
+
+
+class RowIndex:
+    """
+    Base of an in-memory index keyed by image_info.id. Subclasses say
+    which write deps concern them (deps), how to fetch rows (_fetch) and
+    how a row enters and leaves their structures (_clear, _add,
+    _discard); callers take self._lock and call _refresh() before reading.
+
+    max_age > 0: that many seconds after the last full build the next
+    read rebuilds (for writes by other processes, which send no events).
+    background=True: every rebuild but the first runs on a worker thread
+    while reads keep being answered from the current state.
+    """
+
+    deps: Tuple[str, ...] = ("listing",)
+
+    def __init__(self, db, max_age: float = 0, background: bool = False):
+        self.db = db
+        self.max_age = max_age
+        self.background = background
+        self._reset()
+
+        self._dirty: Set[str] = set()   # path deps written since the last refresh
+        self._stale = True              # a write without path deps: rebuild
+        self._rebuilding = False
+        self._replay: Set[str] = set()  # deps applied while a background rebuild ran
+        self._pending = threading.Lock()
+        self._lock = threading.Lock()
+        db.add_write_listener(self._on_write)
+
+    # -------------------
+    # Subclass hooks
+    # -------------------
+    def _fetch(self, ids: Optional[Sequence[int]] = None, after_id: int = 0) -> List[Tuple[Any, ...]]:
+        """Rows (id, full_path, ...) by id, or the next chunk with id > after_id."""
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        """Empty the subclass's structures."""
+        raise NotImplementedError
+
+    def _add(self, row: Tuple[Any, ...]) -> Any:
+        """Account for a fetched row; returns what _discard() gets back."""
+        raise NotImplementedError
+
+    def _discard(self, entry: Any) -> None:
+        raise NotImplementedError
+
+    def _changed(self) -> None:
+        """Called after rows were added or removed."""
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _reset(self) -> None:
+        # everything a rebuild replaces
+        self._rows: Dict[int, Tuple[str, Any]] = {}   # id -> (path dep, _add() result)
+        self._ids: Dict[str, int] = {}   # path dep -> id
+        self._max_id = 0
+        self._built: Optional[float] = None   # monotonic time of the last full build
+        self._clear()
+
+    def _on_write(self, deps: Set[str]) -> None:
+        # runs on the writer's thread: only note what changed, reads apply it
+        if not any(d in deps for d in self.deps):
+            return
+        paths = {d for d in deps if d.startswith("path:")}
+        with self._pending:
+            if paths:
+                self._dirty |= paths
+            else:
+                self._stale = True
+
+    def _refresh(self) -> None:
+        """Bring the index up to date. Caller holds self._lock."""
+        with self._pending:
+            dirty, self._dirty = self._dirty, set()
+            stale, self._stale = self._stale, False
+            if self._rebuilding:
+                self._replay |= dirty
+
+        expired = self.max_age > 0 and self._built is not None and time.monotonic() - self._built > self.max_age
+        if self._built is None or ((stale or expired) and not self.background):
+            self._rebuild()
+        else:
+            if stale or expired:
+                self._start_rebuild(stale)
+            if dirty:
+                self._apply(dirty)
+
+    def _rebuild(self) -> None:
+        self._reset()
+        self._built = time.monotonic()
+        self._load_new()
+        self._changed()
+
+    def _start_rebuild(self, stale: bool) -> None:
+        with self._pending:
+            if self._rebuilding:
+                # a stale mark must not be lost to the rebuild already running
+                self._stale = self._stale or stale
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name=f"{type(self).__name__}-rebuild", daemon=True).start()
+
+    def _rebuild_in_background(self) -> None:
+        # fill a second instance off the request path, then swap its state in
+        fresh = object.__new__(type(self))
+        fresh.db = self.db
+        try:
+            fresh._reset()
+            fresh._built = time.monotonic()
+            fresh._load_new()
+        except Exception:
+            log.exception("%s: background rebuild failed", type(self).__name__)
+            with self._pending:
+                self._rebuilding = False
+                self._replay.clear()
+                self._stale = True   # try again on the next read
+            return
+        with self._lock:
+            vars(self).update({k: v for k, v in vars(fresh).items() if k != "db"})
+            with self._pending:
+                # writes the fresh copy may have read before they happened
+                self._dirty |= self._replay
+                self._replay = set()
+                self._rebuilding = False
+            self._changed()
+
+    def _apply(self, dirty: Set[str]) -> None:
+        known = [self._ids[d] for d in dirty if d in self._ids]
+        if known:
+            found = set()
+            for row in self._fetch(ids=known):
+                self._put(row)
+                found.add(row[0])
+            gone = [i for i in known if i not in found]
+            for image_id in gone:
+                self._remove(image_id)
+            if gone:
+                # SQLite hands out max(rowid) + 1 again once the top row is gone
+                self._max_id = max(self._rows, default=0)
+        # paths not seen before are new rows (or moved to a known id above)
+        self._load_new()
+        self._changed()
+
+    def _load_new(self) -> None:
+        while True:
+            rows = self._fetch(after_id=self._max_id)
+            if not rows:
+                return
+            for row in rows:
+                self._put(row)
+            self._max_id = max(self._max_id, rows[-1][0])
+
+    def _put(self, row: Tuple[Any, ...]) -> None:
+        image_id, full_path = row[0], row[1]
+        self._remove(image_id)
+        dep = _path_dep(full_path)
+        self._rows[image_id] = (dep, self._add(row))
+        self._ids[dep] = image_id
+
+    def _remove(self, image_id: int) -> None:
+        entry = self._rows.pop(image_id, None)
+        if entry is None:
+            return
+        dep, added = entry
+        if self._ids.get(dep) == image_id:
+            del self._ids[dep]
+        self._discard(added)
@@ -0,0 +1,183 @@
+# snapshot.py
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from database import IMAGE_COLUMNS, ImageDBService
+from tagmanager import split_tags
+
+# The whole catalog (image_info, its tags and the stored EXIF of
+# image_exif) as one Arrow IPC file, so a new node can be seeded or a
+# report run without re-extracting every file or SELECT * on the server.
+#
+#   python snapshot.py export catalog.arrow
+#   python snapshot.py import catalog.arrow [--rebase /old/uploads=/srv/uploads]
+#
+# Export streams: each chunk of the server-side cursor becomes one record
+# batch, so memory stays flat. The file is uncompressed by default, which
+# lets import (and any reader) memory-map it instead of reading it.
+#
+# Columns: IMAGE_COLUMNS, "tags" (list of the exif_xpkeywords tags, for
+# analytics; image_tags is rebuilt from exif_xpkeywords on import) and
+# "exif" (image_exif data as JSON text, null when none is stored).
+# pandas reads it directly:
+#
+#   df = pandas.read_feather("catalog.arrow")
+
+SNAPSHOT_VERSION = "1"
+
+
+@functools.lru_cache(maxsize=None)
+def _pyarrow():
+    # optional: only snapshots need it
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+    except ImportError:
+        raise RuntimeError("snapshots need pyarrow (pip install pyarrow)") from None
+    return pa
+
+
+def snapshot_schema():
+    pa = _pyarrow()
+    text = pa.string()
+    stamp = pa.timestamp("s")
+    types = {"exif_datetime": stamp, "created_time": stamp}
+    fields = [pa.field(c, types.get(c, text)) for c in IMAGE_COLUMNS]
+    fields += [pa.field("tags", pa.list_(text)), pa.field("exif", text)]
+    return pa.schema(fields)
+
+
+def export_snapshot(
+    db: ImageDBService,
+    path: str | Path,
+    chunk_size: int = 10000,
+    compression: Optional[str] = None,
+) -> int:
+    """
+    Write the catalog to path (atomically: a temp file is renamed over
+    it when done). compression "lz4"/"zstd" makes the file smaller but
+    no longer memory-mappable. Returns rows written.
+    """
+    pa = _pyarrow()
+    path = Path(path)
+    schema = snapshot_schema().with_metadata({
+        "snapshot_version": SNAPSHOT_VERSION,
+        "source": db.backend.name,
+        "exported": datetime.now().isoformat(timespec="seconds"),
+    })
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    written = 0
+    try:
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for rows in db.iter_catalog(chunk_size):
+                for r in rows:
+                    r["tags"] = split_tags(r.get("exif_xpkeywords"))
+                    r["exif"] = r.pop("exif_data", None)
+                writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+                written += len(rows)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return written
+
+
+def iter_snapshot(
+    path: str | Path,
+    rebase: Optional[Tuple[str, str]] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Records of a snapshot file, one list per record batch, in the form
+    ImageDBService.bulk_upsert() takes (stored EXIF as "exif_extra").
+    rebase=(old, new) replaces the leading old of every full_path, for a
+    node whose upload folder lives elsewhere.
+    """
+    pa = _pyarrow()
+    with pa.memory_map(str(path), "r") as source:
+        reader = pa.ipc.open_file(source)
+        names = set(reader.schema.names)
+        if "full_path" not in names:
+            raise ValueError(f"{path} is not a catalog snapshot (no full_path column)")
+        columns = [c for c in IMAGE_COLUMNS if c in names]
+        has_exif = "exif" in names
+
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            records = batch.select(columns).to_pylist()
+            extras = batch.column("exif").to_pylist() if has_exif else [None] * len(records)
+            for record, extra in zip(records, extras):
+                if rebase and record["full_path"].startswith(rebase[0]):
+                    record["full_path"] = rebase[1] + record["full_path"][len(rebase[0]):]
+                if extra:
+                    record["exif_extra"] = json.loads(extra)
+            yield records
+
+
+def import_snapshot(
+    db: ImageDBService,
+    path: str | Path,
+    rebase: Optional[Tuple[str, str]] = None,
+) -> Dict[str, int]:
+    """
+    Bulk-load a snapshot through ImageDBService.ingest(): one upsert per
+    ingest.batch_size rows, keyed on full_path like any ingest, so it can
+    be run on an empty or a populated database.
+    """
+    return db.ingest(iter_snapshot(path, rebase))
+
+
+def read_frame(path: str | Path, columns: Optional[List[str]] = None):
+    """The snapshot as a pandas DataFrame (memory-mapped read)."""
+    pa = _pyarrow()
+    with pa.memory_map(str(path), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Catalog snapshots (Arrow IPC) for fast reload and analytics.")
+    parser.add_argument("--config", default="config.yaml")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    out = sub.add_parser("export", help="write the catalog to a snapshot file")
+    out.add_argument("path")
+    out.add_argument("--chunk-size", type=int, default=10000, help="rows per record batch")
+    out.add_argument("--compression", choices=["lz4", "zstd"], help="smaller file, but not memory-mappable")
+    load = sub.add_parser("import", help="bulk-load a snapshot into the database")
+    load.add_argument("path")
+    load.add_argument("--rebase", metavar="OLD=NEW", help="rewrite the full_path prefix OLD to NEW")
+    args = parser.parse_args(argv)
+
+    db = ImageDBService(Config(args.config))
+    try:
+        if args.cmd == "export":
+            print("exported:", export_snapshot(db, args.path, args.chunk_size, args.compression))
+        else:
+            rebase = None
+            if args.rebase:
+                old, sep, new = args.rebase.partition("=")
+                if not sep:
+                    parser.error("--rebase must be OLD=NEW")
+                rebase = (old, new)
+            print(import_snapshot(db, args.path, rebase))
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"snapshot {args.cmd} failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# storage.py
+from __future__ import annotations
+
+import importlib.util
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+from config import Config
+
+
+# Everything ImageDBService needs that differs between database servers.
+# The service writes its SQL once, in MySQL's %s paramstyle; a backend
+# hands out DB-API connections that accept it plus cursor(dictionary=True),
+# and renders the few statements without a common syntax (upserts,
+# row locks, schema migrations).
+
+
+class StorageBackend:
+    """
+    Interface implemented by MySQLBackend and SQLiteBackend.
+
+    connect() returns a connection whose close() gives it back (to the
+    pool / the thread). upsert_sql() takes update expressions written
+    with a {new} placeholder for the incoming value, e.g.
+    "COALESCE({new}, exif_make)".
+    """
+
+    name = ""
+
+    def __init__(self, config: Config | None = None):
+        self.config = config or Config()
+        self.pool_timeout = float(self.config._get("database.pool_timeout", 10))
+
+    def connect(self):
+        raise NotImplementedError
+
+    def upsert_sql(self, table: str, columns: Sequence[str], key: str,
+                   updates: Dict[str, str], rows: int) -> str:
+        raise NotImplementedError
+
+    def insert_new_sql(self, table: str, columns: Sequence[str]) -> str:
+        """
+        Single-row INSERT that skips a row colliding with a unique key
+        (as the column's collation compares it) instead of failing.
+        """
+        raise NotImplementedError
+
+    def updated_rows(self, affected: int, inserted: int) -> int:
+        """Rows changed by an upsert, from its rowcount and the insert count."""
+        raise NotImplementedError
+
+    def json_text(self, column: str) -> str:
+        """SQL for the scalar at JSON path %s inside a text column, unquoted."""
+        raise NotImplementedError
+
+    def for_update(self, conn) -> str:
+        """
+        Lock clause for a SELECT whose rows are about to be rewritten in
+        the same transaction (may start that transaction itself).
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def _installed(module: str) -> bool:
+    """True if module can be imported (without importing it)."""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+# -----------------------------
+# MySQL
+# -----------------------------
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+
+    def __init__(self, config: Config | None = None):
+        super().__init__(config)
+        # optional: only needed for database.type: mysql; imported with the pool
+        if not _installed("mysql.connector"):
+            raise RuntimeError("database.type is mysql but mysql-connector-python is not installed")
+        self.host = self.config._get("database.host", "localhost")
+        self.user = self.config._get("database.user", "root")
+        self.password = self.config._get("database.password", "1234")
+        self.database = self.config._get("database.database", "image_gallery")
+        self.pool_size = int(self.config._get("database.pool_size", 5))
+        self.connect_timeout = int(self.config._get("database.connect_timeout", 5))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # created on first use so importing/constructing never hits the server
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    from mysql.connector import pooling
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=f"{self.database}_{id(self)}",
+                        pool_size=self.pool_size,
+                        pool_reset_session=True,
+                        host=self.host,
+                        user=self.user,
+                        password=self.password,
+                        database=self.database,
+                        connection_timeout=self.connect_timeout,
+                    )
+        return self._pool
+
+    def connect(self):
+        """
+        Borrow a connection from the pool (close() hands it back).
+        Waits up to database.pool_timeout seconds when all are in use.
+        """
+        pool = self._get_pool()
+        from mysql.connector.errors import PoolError
+        deadline = time.monotonic() + self.pool_timeout
+        while True:
+            try:
+                return pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.01)
+
+    def upsert_sql(self, table, columns, key, updates, rows):
+        row_marks = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        sets = ",\n    ".join(
+            f"{col} = {expr.format(new=f'VALUES({col})')}" for col, expr in updates.items()
+        )
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)})\n"
+            f"VALUES {', '.join([row_marks] * rows)}\n"
+            f"ON DUPLICATE KEY UPDATE\n    {sets}"
+        )
+
+    def insert_new_sql(self, table, columns):
+        # not INSERT IGNORE: that would also swallow errors other than the duplicate
+        marks = ", ".join(["%s"] * len(columns))
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks})\n"
+            f"ON DUPLICATE KEY UPDATE {columns[0]} = {columns[0]}"
+        )
+
+    def updated_rows(self, affected, inserted):
+        # affected rows: 1 per insert, 2 per changed update, 0 per no-op
+        return max(0, (affected - inserted) // 2)
+
+    def json_text(self, column):
+        return f"JSON_UNQUOTE(JSON_EXTRACT({column}, %s))"
+
+    def for_update(self, conn):
+        return " FOR UPDATE"
+
+
+# -----------------------------
+# SQLite
+# -----------------------------
+def _sqlite_datetime(raw: bytes) -> Any:
+    text = raw.decode("utf-8", "replace")
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+# DATETIME columns come back as datetime objects, as they do from MySQL
+sqlite3.register_converter("DATETIME", _sqlite_datetime)
+
+
+def _sqlite_param(value: Any) -> Any:
+    # stored as ISO text: sorts and compares correctly as a string
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+class _SQLiteCursor:
+    """DB-API cursor taking %s placeholders (translated to ?)."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> "_SQLiteCursor":
+        self._cursor.execute(sql.replace("%s", "?"), [_sqlite_param(v) for v in params])
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Iterable[Any]]) -> "_SQLiteCursor":
+        self._cursor.executemany(
+            sql.replace("%s", "?"),
+            ([_sqlite_param(v) for v in params] for params in seq_of_params),
+        )
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int | None = None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """
+    The calling thread's connection. close() keeps it open for the
+    thread's next call; that is SQLite's equivalent of a pool.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self, dictionary: bool = False, **_kwargs) -> _SQLiteCursor:
+        cur = self._conn.cursor()
+        if dictionary:
+            cur.row_factory = _dict_row
+        return _SQLiteCursor(cur)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def close(self) -> None:
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded database file (database.path), no server and no network
+    hop. WAL journal: readers never block the writer or each other.
+    Each thread keeps one open connection; sqlite3 caches the prepared
+    statements of each connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, config: Config | None = None):
+        super().__init__(config)
+        self.path = Path(self.config.DB_PATH or "data/app.db")
+        self.cache_mb = int(self.config._get("database.sqlite_cache_mb", 64))
+        self._local = threading.local()
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> _SQLiteConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _SQLiteConnection(self._open())
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            str(self.path),
+            timeout=self.pool_timeout,         # wait this long for the write lock
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")   # durable at checkpoints, safe with WAL
+        conn.execute(f"PRAGMA cache_size = {-self.cache_mb * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def upsert_sql(self, table, columns, key, updates, rows):
+        row_marks = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        sets = {col: expr.format(new=f"excluded.{col}") for col, expr in updates.items()}
+        # skip no-op updates so rowcount counts changed rows only
+        changed = " OR ".join(f"{col} IS NOT ({expr})" for col, expr in sets.items())
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)})\n"
+            f"VALUES {', '.join([row_marks] * rows)}\n"
+            f"ON CONFLICT({key}) DO UPDATE SET\n    "
+            + ",\n    ".join(f"{col} = {expr}" for col, expr in sets.items())
+            + f"\nWHERE {changed}"
+        )
+
+    def insert_new_sql(self, table, columns):
+        marks = ", ".join(["%s"] * len(columns))
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks})\nON CONFLICT DO NOTHING"
+
+    def updated_rows(self, affected, inserted):
+        return max(0, affected - inserted)
+
+    def json_text(self, column):
+        # JSON1 is built into every SQLite Python ships with
+        return f"json_extract({column}, %s)"
+
+    def for_update(self, conn):
+        # no row locks: take the database write lock up front instead
+        if not conn.in_transaction:
+            conn._conn.execute("BEGIN IMMEDIATE")
+        return ""
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        self._local = threading.local()
+
+
+BACKENDS = {
+    "mysql": MySQLBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def open_backend(config: Config | None = None) -> StorageBackend:
+    """Backend named by database.type (default mysql)."""
+    config = config or Config()
+    name = str(config.DB_TYPE or "mysql").lower()
+    try:
+        return BACKENDS[name](config)
+    except KeyError:
+        raise ValueError(f"unknown database.type {name!r} (expected one of {', '.join(BACKENDS)})") from None
+
+
+if __name__ == "__main__":
+    backend = open_backend(Config("config.yaml"))
+    conn = backend.connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        print(backend.name, cur.fetchone())
+    finally:
+        conn.close()
@@ -1,6 +1,28 @@
 from config import Config 
 from datetime import datetime
 
+# longest tag the image_tags index stores (utf8mb4 index limit)
+MAX_TAG_LENGTH = 191
+
+
+def split_tags(value: str | None) -> list[str]:
+    """
+    "sunrise, mountains;sky" -> ["sunrise", "mountains", "sky"]
+    Accepts both separators (Windows XPKeywords use ';'), drops blanks,
+    NULs and duplicates, keeps first-seen order. Duplicates compare
+    case-insensitively ("Sky" and "sky" are one tag), like image_tags
+    on both backends.
+    """
+    out: list[str] = []
+    seen: set[str] = set()
+    for part in (value or "").replace(";", ",").split(","):
+        t = part.strip().strip("\x00").strip()[:MAX_TAG_LENGTH]
+        if t and t.casefold() not in seen:
+            seen.add(t.casefold())
+            out.append(t)
+    return out
+
+
 class TagManager:
     def __init__(self,config: Config | None = None):
         self.config = config or Config()
@@ -8,15 +30,8 @@ class TagManager:
 
 #-------- ADD TAGS OR EDIT TAGS ----------
     def merge_tags(self, initial_tags: str | None, tags: list[str]) -> str:
-        base = [t.strip() for t in (initial_tags or "").split(",") if t.strip()]
-        incoming = [t.strip() for t in tags if t.strip()]
-
-        merged = base[:]  # start with existing tags
-        for t in incoming:
-            if t not in merged:
-                merged.append(t)
-
-        return ",".join(merged)
+        # split_tags on both sides: the string always matches what image_tags indexes
+        return ",".join(split_tags(",".join([initial_tags or ""] + list(tags))))
 #----- CHECK FOR DATE ------   
     def is_datetime_string(self, s: str) -> bool:
         try:
@@ -46,16 +61,8 @@ class TagManager:
         return new_dt, new_make, new_model
 #--------- DELETE TAGS ---------
     def delete_tags(self,initial_tags: str | None, tags: list[str]):
-        if initial_tags:
-            base = [t.strip() for t in initial_tags.split(",") if t.strip()]
-        incoming = [t.strip() for t in tags if t.strip()]
-        new_tags = [] + base
-        for i in range(len(incoming)):
-            if incoming[i] in base:
-                new_tags.remove(incoming[i])
-            else:
-                pass
-        return ",".join(new_tags)
+        removed = {t.casefold() for t in split_tags(",".join(tags))}
+        return ",".join(t for t in split_tags(initial_tags) if t.casefold() not in removed)
 
 #----- AT MAIN -------
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+# thumbnails.py
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config import Config
+from fingerprint import content_hash
+from metrics import INGEST_FILES, ingest_stage
+
+
+@functools.lru_cache(maxsize=None)
+def _pillow():
+    # imported on the first render: a web worker serving cached thumbs never loads it
+    from PIL import Image, ImageOps
+    try:
+        # optional: lets Pillow decode HEIC/HEIF
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+    return Image, ImageOps
+
+
+def decode_errors() -> tuple:
+    """What a failed render raises: missing file, undecodable data, or an oversized image."""
+    Image, _ = _pillow()
+    return (OSError, ValueError, Image.DecompressionBombError)
+
+
+@functools.lru_cache(maxsize=65536)
+def _digest(path: str, size: int, mtime_ns: int, ino: int, sample_bytes: int) -> str:
+    # memoised per stat signature: a cache hit costs a stat(), not a read
+    value = content_hash(path, sample_bytes)
+    if value is None:
+        raise FileNotFoundError(path)
+    return value
+
+
+_MIMETYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class ThumbnailCache:
+    """
+    Downscaled JPEG/WebP copies of the originals, stored on disk:
+
+        <thumbnails.dir>/<key[:2]>/<key>.<format>
+
+    key = sha1(size, format, content hash), the same sampled hash as
+    image_info.content_hash (fingerprint.py): a moved or renamed file and
+    byte-identical copies share one entry, an edited original gets a new
+    one and stale ones just age out.
+    The cache is bounded by thumbnails.max_cache_mb; least recently used
+    files (by mtime, refreshed on every hit) are evicted first.
+    """
+
+    def __init__(self, config: Config | None = None):
+        self.config = config or Config()
+        self.cache_dir = Path(self.config.THUMB_DIR)
+        self.sizes: Dict[str, int] = {k: int(v) for k, v in self.config.THUMB_SIZES.items()}
+        self.format = self.config.THUMB_FORMAT if self.config.THUMB_FORMAT in _MIMETYPES else "jpeg"
+        self.quality = self.config.THUMB_QUALITY
+        self.max_bytes = int(self.config.THUMB_MAX_CACHE_MB) * 1024 * 1024
+
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None   # computed on first write
+
+    @property
+    def mimetype(self) -> str:
+        return _MIMETYPES[self.format]
+
+    def get(self, source: str | Path, size: str, digest: str | None = None) -> Path:
+        """
+        Path of the thumbnail for source at the named size, generating it
+        on first request. digest: the file's content hash when the caller
+        already has it (e.g. image_info.content_hash).
+
+        Raises:
+          KeyError    unknown size name
+          decode_errors()   source missing / not decodable / too large
+        """
+        px = self.sizes[size]
+        source = Path(source)
+        target = self._cache_path(source, px, digest)
+
+        if target.exists():
+            # LRU bookkeeping: mtime = last use
+            try:
+                os.utime(target)
+            except OSError:
+                pass
+            return target
+
+        self._render(source, target, px)
+        self._account(target.stat().st_size)
+        return target
+
+    def pregenerate(self, sources: Iterable[str | Path], sizes: List[str] | None = None) -> int:
+        """
+        Bulk generation for freshly ingested files. Files that fail to
+        decode (videos, corrupt images) are skipped.
+        Returns number of thumbnails written or already present.
+        """
+        sizes = sizes or list(self.sizes)
+        errors = decode_errors()
+        done = 0
+        with ingest_stage("thumbnails"):
+            for source in sources:
+                for size in sizes:
+                    try:
+                        self.get(source, size)
+                        done += 1
+                    except errors:
+                        break
+        INGEST_FILES.inc(done, stage="thumbnails")
+        return done
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _cache_path(self, source: Path, px: int, digest: str | None = None) -> Path:
+        if digest is None:
+            st = source.stat()
+            digest = _digest(str(source.resolve()), st.st_size, st.st_mtime_ns, st.st_ino,
+                             self.config.CONTENT_HASH_SAMPLE)
+        ident = f"{px}:{self.format}:{digest}"
+        key = hashlib.sha1(ident.encode("utf-8")).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}.{self.format}"
+
+    def _render(self, source: Path, target: Path, px: int) -> None:
+        Image, ImageOps = _pillow()
+        with Image.open(source) as im:
+            # JPEG: let libjpeg decode at 1/2..1/8 scale directly
+            im.draft("RGB", (px, px))
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((px, px))
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                im.save(tmp, format=self.format.upper(), quality=self.quality)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+        # atomic: concurrent requests for the same thumb never see a partial file
+        os.replace(tmp, target)
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(f.stat().st_size for f in self.cache_dir.rglob(f"*.{self.format}"))
+            else:
+                self._total_bytes += added
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used files until the cache is at 90% of its limit."""
+        files = []
+        for f in self.cache_dir.rglob(f"*.{self.format}"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        goal = int(self.max_bytes * 0.9)
+        for _, size, f in files:
+            if total <= goal:
+                break
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+
+if __name__ == "__main__":
+    from reader import FileReader
+
+    config = Config("config.yaml")
+    thumbs = ThumbnailCache(config)
+    base = Path(config.UPLOAD_FOLDER)
+    n = thumbs.pregenerate(base / rel for rel in FileReader(config).iter_images(base))
+    print("thumbnails ready:", n)
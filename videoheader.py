@@ -0,0 +1,235 @@
+# videoheader.py
+from __future__ import annotations
+
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from exifheader import _iter_boxes, _iter_file_boxes
+
+# MP4/MOV metadata from the box headers only: top-level boxes are walked
+# by seeking (mdat is never read), then the few small boxes under moov
+# that carry metadata:
+#
+#   moov/mvhd              creation time (UTC), duration
+#   moov/trak/tkhd         width, height (of the video track, per mdia/hdlr)
+#   moov/udta/(c)mak ...   QuickTime user data: make, model, date
+#   moov/meta/keys+ilst    Apple mdta: com.apple.quicktime.make, ...creationdate
+#
+# Keys use the EXIF tag names the image path produces, so a video row
+# fills the same image_info columns (DateTime, Make, Model).
+
+_QT_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+_TOP_LEVEL = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+
+# udta/meta may carry cover art or a preview; never read more than this
+_MAX_META_BOX = 1 << 20
+
+# Apple mdta key / QuickTime udta atom -> result key
+_MDTA_KEYS = {
+    b"com.apple.quicktime.make": "Make",
+    b"com.apple.quicktime.model": "Model",
+    b"com.apple.quicktime.creationdate": "DateTime",
+    b"com.apple.quicktime.software": "Software",
+}
+_UDTA_ATOMS = {
+    b"\xa9mak": "Make",
+    b"\xa9mod": "Model",
+    b"\xa9day": "DateTime",
+    b"\xa9swr": "Software",
+}
+
+
+def read_video_meta(path: str | Path) -> Optional[Dict[str, Any]]:
+    """
+    Metadata of an ISOBMFF/QuickTime file (mp4, mov, m4v, 3gp):
+
+      DateTime      "YYYY:MM:DD HH:MM:SS", local time of the recording
+      Make, Model   recording device, when the file says
+      Duration      seconds (float)
+      ImageWidth, ImageHeight   of the first video track
+
+    Only keys that were found are present. None if the file is not an
+    ISOBMFF/QuickTime container or cannot be parsed.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8)
+            if len(head) < 8 or head[4:8] not in _TOP_LEVEL:
+                return None
+
+            for box_type, start, end in _iter_file_boxes(f):
+                if box_type == b"moov":
+                    return _parse_moov(f, start, end)
+            return {}
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+# -----------------------------
+# Internal helpers
+# -----------------------------
+def _parse_moov(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    tagged: Dict[str, Any] = {}   # udta / mdta values win over mvhd's UTC time
+
+    for box_type, s, e in _iter_file_boxes(f, start, end):
+        if box_type == b"mvhd":
+            f.seek(s)
+            out.update(_parse_mvhd(f.read(min(e - s, 120))))
+        elif box_type == b"trak" and "ImageWidth" not in out:
+            out.update(_parse_trak(f, s, e))
+        elif box_type in (b"udta", b"meta") and e - s <= _MAX_META_BOX:
+            f.seek(s)
+            data = f.read(e - s)
+            parsed = _parse_udta(data) if box_type == b"udta" else _parse_mdta(data)
+            for key, value in parsed.items():
+                # mdta (newer, has the time zone) over udta
+                if box_type == b"meta" or key not in tagged:
+                    tagged[key] = value
+
+    out.update(tagged)
+    if "DateTime" in out and not isinstance(out["DateTime"], str):
+        out["DateTime"] = out["DateTime"].strftime("%Y:%m:%d %H:%M:%S")
+    return out
+
+
+def _parse_mvhd(data: bytes) -> Dict[str, Any]:
+    version = data[0]
+    if version == 1:
+        created, _modified, timescale, duration = struct.unpack_from(">QQIQ", data, 4)
+    else:
+        created, _modified, timescale, duration = struct.unpack_from(">IIII", data, 4)
+
+    out: Dict[str, Any] = {}
+    if created:
+        # stored in UTC; EXIF DateTime is local time
+        out["DateTime"] = (_QT_EPOCH + timedelta(seconds=created)).astimezone().replace(tzinfo=None)
+    if timescale and duration not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        out["Duration"] = round(duration / timescale, 3)
+    return out
+
+
+def _parse_trak(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    tkhd = None
+    is_video = False
+    for box_type, s, e in _iter_file_boxes(f, start, end):
+        if box_type == b"tkhd":
+            f.seek(s)
+            tkhd = f.read(min(e - s, 96))
+        elif box_type == b"mdia":
+            for sub_type, ss, se in _iter_file_boxes(f, s, e):
+                if sub_type == b"hdlr":
+                    f.seek(ss)
+                    is_video = f.read(12)[8:12] == b"vide"
+                    break
+    if not is_video or tkhd is None:
+        return {}
+
+    # width/height are the last two 16.16 fixed-point fields
+    # (84 bytes in a version 0 tkhd, 96 in version 1)
+    off = 76 if tkhd[:1] == b"\x00" else 88
+    if len(tkhd) < off + 8:
+        return {}
+    width, height = struct.unpack_from(">II", tkhd, off)
+    if not width or not height:
+        return {}
+    return {"ImageWidth": width >> 16, "ImageHeight": height >> 16}
+
+
+def _parse_udta(data: bytes) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for box_type, s, e in _iter_boxes(data):
+        key = _UDTA_ATOMS.get(box_type)
+        if key is None:
+            continue
+        if data[s + 4:s + 8] == b"data":
+            # iTunes style: (c)xxx -> data box
+            value = _data_box_value(data, s, e)
+        else:
+            # QuickTime text atom: u16 length, u16 language, text
+            length = struct.unpack_from(">H", data, s)[0]
+            value = data[s + 4:min(s + 4 + length, e)].decode("utf-8", "replace")
+        value = _clean(key, value)
+        if value is not None:
+            out[key] = value
+    return out
+
+
+def _parse_mdta(data: bytes) -> Dict[str, Any]:
+    # QuickTime meta has no version/flags, ISO meta does (FullBox)
+    start = 0 if data[4:8] == b"hdlr" else 4
+    keys: Dict[int, bytes] = {}
+    items = None
+    for box_type, s, e in _iter_boxes(data, start):
+        if box_type == b"keys":
+            count = struct.unpack_from(">I", data, s + 4)[0]
+            pos = s + 8
+            for i in range(1, count + 1):
+                size = struct.unpack_from(">I", data, pos)[0]
+                if size < 8 or pos + size > e:
+                    break
+                keys[i] = data[pos + 8:pos + size]   # skips the 'mdta' namespace
+                pos += size
+        elif box_type == b"ilst":
+            items = (s, e)
+    if not keys or items is None:
+        return {}
+
+    out: Dict[str, Any] = {}
+    for box_type, s, e in _iter_boxes(data, *items):
+        key = _MDTA_KEYS.get(keys.get(int.from_bytes(box_type, "big"), b""))
+        if key is None:
+            continue
+        value = _clean(key, _data_box_value(data, s, e))
+        if value is not None:
+            out[key] = value
+    return out
+
+
+def _data_box_value(data: bytes, start: int, end: int) -> Optional[str]:
+    for box_type, s, e in _iter_boxes(data, start, end):
+        if box_type == b"data":
+            # u32 type (1 = UTF-8), u32 locale, value
+            if struct.unpack_from(">I", data, s)[0] & 0xFFFFFF == 1:
+                return data[s + 8:e].decode("utf-8", "replace")
+            return None
+    return None
+
+
+def _clean(key: str, value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    value = value.strip("\x00 ")
+    if not value:
+        return None
+    if key == "DateTime":
+        return _parse_date(value)
+    return value
+
+
+def _parse_date(text: str) -> Optional[datetime]:
+    """
+    "2025-10-05T19:28:21+0530" (Apple), "2025-10-05T14:00:21Z",
+    "2025-10-05 19:28:21" -> naive local time of the recording.
+    """
+    text = text.replace("Z", "+00:00")
+    if len(text) > 5 and text[-5] in "+-" and text[-3] != ":":
+        text = text[:-2] + ":" + text[-2:]   # +0530 -> +05:30
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    # the wall clock where it was recorded: keep it, drop the offset;
+    # a bare UTC stamp is shown in the server's zone instead
+    if dt.tzinfo is not None and dt.utcoffset() == timedelta(0) and text.endswith("+00:00"):
+        dt = dt.astimezone()
+    return dt.replace(tzinfo=None)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for arg in sys.argv[1:]:
+        print(arg, read_video_meta(arg))
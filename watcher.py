@@ -0,0 +1,331 @@
+# watcher.py
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from database import ImageDBService
+from filereader import ExifDataFrameBuilder
+from fingerprint import apply_moves
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len
+
+
+class Inotify:
+    """
+    Minimal ctypes binding for Linux inotify (no extra dependency).
+    Raises OSError where inotify is not available.
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: Dict[int, str] = {}   # watch descriptor -> directory
+
+    def add_watch(self, directory: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch({directory}): {os.strerror(err)}")
+        self.paths[wd] = directory
+        return wd
+
+    def read(self, timeout: float) -> Iterator[Tuple[int, int, int, str]]:
+        """Yield (wd, mask, cookie, name) for events within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            yield wd, mask, cookie, name
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class FolderWatcher:
+    """
+    Keeps image_info in step with UPLOAD_FOLDER as files come and go.
+
+    Filesystem events are collected per path and flushed once the folder
+    has been quiet for watcher.debounce_seconds (or after
+    watcher.max_delay_seconds during a long copy), so a card dump becomes
+    a few batched upserts. Only the touched files are extracted.
+
+    Without inotify (Windows, macOS, watch limit reached) it falls back
+    to a stat-only manifest rescan every watcher.poll_interval_seconds.
+    """
+
+    def __init__(
+        self,
+        config: Config | None = None,
+        db: ImageDBService | None = None,
+        builder: ExifDataFrameBuilder | None = None,
+        thumbs=None,
+    ):
+        self.config = config or Config()
+        self.base = Path(self.config.UPLOAD_FOLDER).resolve()
+        self.db = db or ImageDBService(self.config)
+        self.builder = builder or ExifDataFrameBuilder(self.config)
+        self.thumbs = thumbs
+        if self.thumbs is None and self.config.THUMB_PREGENERATE:
+            from thumbnails import ThumbnailCache
+            self.thumbs = ThumbnailCache(self.config)
+
+        self.debounce = self.config.WATCH_DEBOUNCE
+        self.max_delay = self.config.WATCH_MAX_DELAY
+        self.poll_interval = self.config.WATCH_POLL_INTERVAL
+        self.manifest_interval = self.config.WATCH_MANIFEST_SAVE
+
+        self._pending: Dict[str, float] = {}   # full path -> first event time
+        self._rescan = False
+        self._last_event = 0.0
+        self._retry_at = 0.0   # after a failed sync, don't retry before this
+        self._manifest_saved = time.monotonic()
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        """Catch up on anything missed while stopped, then watch until stop()."""
+        try:
+            self.sync_changes()
+        except Exception as e:
+            # keep watching; the rescan is retried by the first flush
+            print("WATCHER: initial sync failed:", repr(e))
+            self._rescan = True
+        try:
+            ino = Inotify()
+        except OSError as e:
+            print("WATCHER: inotify unavailable, polling instead:", e)
+            self._run_polling()
+            return
+
+        with ino:
+            try:
+                self._watch_tree(ino, self.base)
+            except OSError as e:
+                print("WATCHER: cannot watch the whole tree, polling instead:", e)
+                self._run_polling()
+                return
+            print(f"WATCHER: watching {len(ino.paths)} directories under {self.base}")
+            self._run_inotify(ino)
+
+        self._flush()
+        self.builder.manifest.save()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def sync_changes(self) -> None:
+        """Stat-only manifest rescan; extracts only new/changed files."""
+        changes = self.builder.scan_changes(self.base)
+        self._apply(changes.to_extract, changes.deleted)
+        self.builder.manifest.save()
+        self._manifest_saved = time.monotonic()
+
+    # -------------------
+    # Internal helpers
+    # -------------------
+    def _run_polling(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.sync_changes()
+            except Exception as e:
+                print("WATCHER: sync failed, retrying next poll:", repr(e))
+
+    def _run_inotify(self, ino: Inotify) -> None:
+        while not self._stop.is_set():
+            for wd, mask, _cookie, name in ino.read(timeout=min(self.debounce, 1.0)):
+                self._handle(ino, wd, mask, name)
+
+            if self._due():
+                self._flush()
+            if self.builder.manifest.dirty and \
+                    time.monotonic() - self._manifest_saved >= self.manifest_interval:
+                try:
+                    self.builder.manifest.save()
+                except OSError as e:
+                    print("WATCHER: manifest save failed:", e)
+                self._manifest_saved = time.monotonic()
+
+    def _handle(self, ino: Inotify, wd: int, mask: int, name: str) -> None:
+        now = time.monotonic()
+        if mask & IN_Q_OVERFLOW:
+            # kernel dropped events: fall back to one stat-only rescan
+            self._rescan = True
+            self._last_event = now
+            return
+
+        directory = ino.paths.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            ino.paths.pop(wd, None)
+            return
+        if not name:
+            return   # event on the watched directory itself
+
+        path = os.path.join(directory, name)
+        self._last_event = now
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # new subtree: watch it and pick up files already inside
+                try:
+                    self._watch_tree(ino, Path(path))
+                    for rel in self.builder.reader.iter_images(path):
+                        self._pending.setdefault(os.path.join(path, rel), now)
+                except OSError:
+                    # gone or renamed already (e.g. an upload's temp dir)
+                    self._rescan = True
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                rel_dir = os.path.relpath(path, self.base)
+                for full_path in self.builder.manifest.paths_under(rel_dir):
+                    self._pending.setdefault(full_path, now)
+            return
+
+        if self.builder.reader._is_allowed(Path(name)):
+            self._pending.setdefault(path, now)
+
+    def _watch_tree(self, ino: Inotify, root: Path) -> None:
+        ino.add_watch(str(root))
+        for dirpath, dirnames, _ in os.walk(root):
+            for d in dirnames:
+                ino.add_watch(os.path.join(dirpath, d))
+
+    def _due(self) -> bool:
+        if not self._pending and not self._rescan:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        oldest = min(self._pending.values(), default=now)
+        return now - self._last_event >= self.debounce or now - oldest >= self.max_delay
+
+    def _flush(self) -> None:
+        paths, self._pending = list(self._pending), {}
+        rescan, self._rescan = self._rescan, False
+        try:
+            if rescan:
+                self.sync_changes()
+            elif paths:
+                self._sync_paths(paths)
+        except Exception as e:
+            # DB down, bad file, full disk...: keep the work and retry with a
+            # full rescan after poll_interval instead of killing the thread
+            print("WATCHER: sync failed, retrying:", repr(e))
+            now = time.monotonic()
+            for p in paths:
+                self._pending.setdefault(p, now)
+            self._rescan = True
+            self._retry_at = now + self.poll_interval
+
+    def _sync_paths(self, paths: List[str]) -> None:
+        upserts: List[str] = []
+        deletes: List[str] = []
+        stats: Dict[str, Optional[os.stat_result]] = {}
+        for p in paths:
+            rel = os.path.relpath(p, self.base)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                deletes.append(str(Path(p).resolve()))
+                stats[rel] = None
+                continue
+            if stat.S_ISREG(st.st_mode):
+                upserts.append(str(Path(p).resolve()))
+                stats[rel] = st
+
+        self._apply(upserts, deletes)
+        self.builder.manifest.update(self.base, stats)
+
+    def _apply(self, upserts: List[str], deletes: List[str]) -> None:
+        # a move shows up as delete + create; same content -> path update only
+        hashes: Dict[str, str] = {}   # files hashed for move detection; extraction reuses them
+        moved = apply_moves(self.db, upserts, deletes, self.config.CONTENT_HASH_SAMPLE, hashes)
+        if moved:
+            print("WATCHER: MOVED:", len(moved))
+            new = set(moved.values())
+            upserts = [p for p in upserts if p not in new]
+            deletes = [p for p in deletes if p not in moved]
+            if self.thumbs is not None:
+                self.thumbs.pregenerate(list(new))
+
+        if upserts:
+            counts = self.db.ingest(self.builder.iter_batches(files=upserts, hashes=hashes))
+            print("WATCHER: SYNCED:", counts)
+            if self.thumbs is not None:
+                self.thumbs.pregenerate(upserts)
+        if deletes:
+            print("WATCHER: REMOVED:", self.db.delete_images(deletes))
+
+
+def start_in_background(
+    config: Config | None = None,
+    db: ImageDBService | None = None,
+    builder: ExifDataFrameBuilder | None = None,
+    thumbs=None,
+) -> FolderWatcher:
+    """Run a FolderWatcher on a daemon thread (e.g. next to the Flask app)."""
+    watcher = FolderWatcher(config, db, builder, thumbs)
+    threading.Thread(target=watcher.run, name="folder-watcher", daemon=True).start()
+    return watcher
+
+
+if __name__ == "__main__":
+    watcher = FolderWatcher(Config("config.yaml"))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -1,50 +1,283 @@
-from flask import Flask, render_template, send_from_directory, abort, request, redirect, url_for
-
+from flask import Flask, render_template, send_file, abort, request, redirect, url_for, jsonify, g, Response, stream_with_context
+
+import hashlib
+import logging
+import mimetypes
+import os
+import stat
+import time
 from pathlib import Path
 from datetime import datetime
 
 from config import Config
-from database import ImageDBService   # <-- your uploaded database.py
-from tagmanager import TagManager
-from filereader import ExifDataFrameBuilder
+from database import ImageDBService, next_cursor   # <-- your uploaded database.py
+from tagmanager import TagManager, split_tags
+from thumbnails import ThumbnailCache, decode_errors
+from export import FORMATS as EXPORT_FORMATS, encode_chunks
+from phash import DuplicateIndex
+from facets import FacetIndex
+from fingerprint import apply_moves
+import metrics
+
+log = logging.getLogger(__name__)
 
 cfg = Config("config.yaml")
 web = Flask(__name__)
 
 db = ImageDBService(cfg)
 tagm = TagManager(cfg)
-file_r = ExifDataFrameBuilder(cfg)
+thumbs = ThumbnailCache(cfg)
+dups = DuplicateIndex(db, cfg.DUPLICATE_DISTANCE)
+facets = FacetIndex(db, cfg.FACETS_MAX_AGE)
 
 BASE_DIR = Path(cfg.UPLOAD_FOLDER).resolve()
 
+# zero-copy: let the front server (Apache/lighttpd/nginx module) send the file
+web.config["USE_X_SENDFILE"] = cfg.USE_X_SENDFILE
+# not in every platform's mime table; the library has lots of these
+mimetypes.add_type("image/heic", ".heic")
+mimetypes.add_type("image/heif", ".heif")
+mimetypes.add_type("video/quicktime", ".mov")
+
+# a year: URLs carrying the file's version never change content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# ---------- REQUEST TIMING (see /metrics) --------
+@web.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+
+@web.after_request
+def _record_timing(response):
+    started = g.pop("started", None)
+    if started is not None:
+        # route template, not the raw path, so labels stay bounded
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            route=route, method=request.method, status=response.status_code,
+        )
+    return response
+
+def _cache_metrics():
+    stats = db.cache_stats()
+    if not stats:
+        return []
+    lines = ["# HELP gallery_query_cache_entries Entries in the query result cache.",
+             "# TYPE gallery_query_cache_entries gauge",
+             f"gallery_query_cache_entries {stats['entries']}",
+             "# HELP gallery_query_cache_events_total Query result cache events.",
+             "# TYPE gallery_query_cache_events_total counter"]
+    for event in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        lines.append(f'gallery_query_cache_events_total{{event="{event}"}} {stats[event]}')
+    return lines
+
+metrics.REGISTRY.add_collector(_cache_metrics)
+
+def file_version(st: os.stat_result) -> str:
+    """Short token that changes whenever the file does (size, mtime, inode)."""
+    raw = f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}".encode("ascii")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
 @web.route("/uploads/<path:relpath>")
 def uploads(relpath):
+    """
+    Originals, with ETag/Last-Modified validation (304s) and Range
+    support (seeking in videos) via send_file(conditional=True).
+
+    /uploads/<relpath>?v=<file_version> (what the gallery links to) is
+    cached as immutable for a year; a changed file gets a new v. Without
+    v, or with a stale one, clients must revalidate on every use.
+    """
     # block path traversal
     target = (BASE_DIR / relpath).resolve()
     if not str(target).startswith(str(BASE_DIR)):
         abort(403)
-    return send_from_directory(str(BASE_DIR), relpath)
+    try:
+        st = target.stat()
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    version = file_version(st)
+    immutable = request.args.get("v") == version
+    response = send_file(
+        target,
+        conditional=True,
+        etag=version,
+        last_modified=st.st_mtime,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+# ---------- THUMBNAILS FOR THE GALLERY GRID --------
+@web.route("/thumbs/<size>/<path:relpath>")
+def thumbnail(size, relpath):
+    if size not in thumbs.sizes:
+        abort(404)
+    target = (BASE_DIR / relpath).resolve()
+    if not str(target).startswith(str(BASE_DIR)):
+        abort(403)
+    try:
+        version = file_version(target.stat())
+        thumb = thumbs.get(target, size)
+    except decode_errors():
+        # missing file, nothing Pillow can decode (e.g. video) or a decompression bomb
+        abort(404)
+    # like /uploads: cached hard only under the original's current ?v=,
+    # otherwise revalidated (the file name is the content-based cache key)
+    immutable = request.args.get("v") == version
+    response = send_file(
+        thumb,
+        mimetype=thumbs.mimetype,
+        conditional=True,
+        etag=thumb.stem,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 # ---------- WEB ROUTE FOR VIEWING GALLERY --------
 @web.route("/gallery")
 def gallery():
-    q = (request.args.get("q") or "").strip()
-    d = (request.args.get("date") or "").strip()
-    g = (request.args.get("g") or "").strip()
-    
+    filters = gallery_filters(request.args)
 
-    exif_date = None
-    if d:
-        exif_date = datetime.strptime(d, "%Y-%m-%d").date()
+    try:
+        rows = query_images(filters, limit=cfg.PAGE_SIZE)
+    except ValueError:
+        return "Invalid date, use YYYY-MM-DD", 400
+    images = to_gallery_items(rows)
+
+    return render_template(
+        "gallery.html", images=images, **filters,
+        thumb_size=cfg.THUMB_GALLERY_SIZE,
+        next_cursor=next_cursor(rows, cfg.PAGE_SIZE),
+        facets=facets.counts(cfg.FACETS_LIMIT),
+        facet_url=lambda name, value: facet_url(filters, name, value),
+    )
+# ---------- JSON LISTING FOR INFINITE SCROLL --------
+@web.route("/api/images")
+def api_images():
+    filters = gallery_filters(request.args)
+    cursor = (request.args.get("cursor") or "").strip() or None
+    start = max(0, request.args.get("start", 0, type=int))
+    limit = max(1, min(request.args.get("limit", cfg.PAGE_SIZE, type=int), cfg.PAGE_SIZE_MAX))
 
-    image_filename = q if q else None
-    tag_file = g if g else None
+    try:
+        rows = query_images(filters, limit=limit, cursor=cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    images = to_gallery_items(rows)
+    html = render_template("_cards.html", images=images, start=start, thumb_size=cfg.THUMB_GALLERY_SIZE)
+
+    return jsonify({
+        "images": [
+            {**img.as_dict(), "exif_datetime": str(img.exif_datetime) if img.exif_datetime else None}
+            for img in images
+        ],
+        "next_cursor": next_cursor(rows, limit),
+        "html": html,
+    })
+
+def gallery_filters(args) -> dict:
+    """Raw search-bar values (also echoed back into the form)."""
+    return {
+        "q": (args.get("q") or "").strip(),
+        "date": (args.get("date") or "").strip(),
+        "date_from": (args.get("from") or "").strip(),
+        "date_to": (args.get("to") or "").strip(),
+        "g": (args.get("g") or "").strip(),
+        "m": (args.get("m") or "all").strip(),
+        "make": (args.get("make") or "").strip(),
+        "model": (args.get("model") or "").strip(),
+    }
 
-    # Show ALL images if nothing entered
-    if exif_date is None and image_filename is None and tag_file is None:
-        rows = db.get_all_images(limit=500)
+def search_args(filters: dict) -> dict:
+    """
+    gallery_filters() -> ImageDBService.search() keyword arguments,
+    or {} when nothing was entered.
+    g is a comma separated tag list; m = "all" (AND) or "any" (OR).
+    date is one day, from/to an inclusive range (either end optional).
+    make/model match the camera exactly (the facet chips set them).
+    Raises ValueError on a malformed date.
+    """
+    def parse(d):
+        return datetime.strptime(d, "%Y-%m-%d").date() if d else None
+
+    exif_date = parse(filters["date"])
+    date_from = parse(filters["date_from"])
+    date_to = parse(filters["date_to"])
+
+    image_filename = filters["q"] or None
+    tag_file = filters["g"] or None
+    make = filters["make"] or None
+    model = filters["model"] or None
+
+    if (exif_date is None and date_from is None and date_to is None
+            and image_filename is None and tag_file is None and make is None and model is None):
+        return {}
+    return dict(exif_datetime=exif_date, image_filename=image_filename, exif_xpkeywords=tag_file,
+                tag_mode="any" if filters["m"] == "any" else "all",
+                date_from=date_from, date_to=date_to, exif_make=make, exif_model=model)
+
+def facet_url(filters: dict, name: str, value) -> str:
+    """
+    Gallery URL for the current filters narrowed by one facet value:
+    make/model replace theirs, a year becomes the from/to range, a tag
+    is added to g.
+    """
+    params = {"q": filters["q"], "date": filters["date"], "from": filters["date_from"],
+              "to": filters["date_to"], "g": filters["g"], "m": filters["m"],
+              "make": filters["make"], "model": filters["model"]}
+    if name == "year":
+        params.update({"date": "", "from": f"{value}-01-01", "to": f"{value}-12-31"})
+    elif name == "tag":
+        # split_tags drops the value if g has it already, in any case
+        params["g"] = ",".join(split_tags(",".join([filters["g"] or "", value])))
     else:
-        rows = db.search(exif_datetime=exif_date, image_filename=image_filename,exif_xpkeywords = tag_file)
-
+        params[name] = value
+    if params["m"] == "all":
+        del params["m"]
+    return url_for("gallery", **{k: v for k, v in params.items() if v})
+
+def query_images(filters: dict, limit: int, cursor: str | None = None):
+    """
+    Rows for the gallery filters, one keyset page at a time.
+    Raises ValueError on a malformed date or cursor.
+    """
+    args = search_args(filters)
+    # Show ALL images if nothing entered
+    if not args:
+        return db.get_all_images(limit=limit, cursor=cursor)
+    return db.search(**args, limit=limit, cursor=cursor)
+
+class GalleryItem:
+    """One gallery card; slots instead of a dict per row (a page holds hundreds)."""
+    __slots__ = ("image_filename", "relpath", "version", "exif_datetime",
+                 "exif_make", "exif_model", "exif_xpkeywords", "kind")
+
+    def __init__(self, image_filename, relpath, version, exif_datetime, exif_make, exif_model, exif_xpkeywords,
+                 kind="image"):
+        self.image_filename = image_filename
+        self.relpath = relpath
+        self.version = version
+        self.exif_datetime = exif_datetime
+        self.exif_make = exif_make
+        self.exif_model = exif_model
+        self.exif_xpkeywords = exif_xpkeywords
+        self.kind = kind   # "image" | "video"
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def to_gallery_items(rows) -> list[GalleryItem]:
     images = []
     for r in rows:
         full_path = r.get("full_path")
@@ -57,17 +290,156 @@ def gallery():
             rel = p.relative_to(BASE_DIR)
         except Exception:
             continue
+        try:
+            version = file_version(p.stat())
+        except OSError:
+            version = None   # gone from disk; link still works once it is back
+
+        images.append(GalleryItem(
+            r.get("image_filename"),
+            str(rel).replace("\\", "/"),
+            version,
+            r.get("exif_datetime"),
+            r.get("exif_make"),
+            r.get("exif_model"),
+            r.get("exif_xpkeywords"),
+            "video" if p.suffix.lower().lstrip(".") in cfg.VIDEO_EXTENSIONS else "image",
+        ))
+    return images
+# ---------- STREAMING EXPORT --------
+@web.route("/api/export")
+def api_export():
+    """
+    Every row matching the gallery filters (q, date, from, to, g, m, make,
+    model; none = whole catalog) as ?format=ndjson (default) or csv. Streamed from a
+    server-side cursor: constant memory, first bytes sent immediately.
+    """
+    fmt = (request.args.get("format") or "ndjson").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        args = search_args(gallery_filters(request.args))
+    except ValueError:
+        return jsonify({"error": "invalid date, use YYYY-MM-DD"}), 400
+
+    chunks = db.iter_search(**args, chunk_size=1000)
+    filename = f"images-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(encode_chunks(chunks, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no",   # nginx: pass chunks through as they come
+        },
+    )
+# ---------- FACET COUNTS --------
+@web.route("/api/facets")
+def api_facets():
+    """Image counts per make, model, year and tag (?limit= values per facet)."""
+    limit = max(1, min(request.args.get("limit", cfg.FACETS_LIMIT, type=int), cfg.PAGE_SIZE_MAX))
+    return jsonify(facets.counts(limit))
+# ---------- NEAR-DUPLICATES --------
+def _relpath(full_path: str) -> str:
+    try:
+        return Path(full_path).relative_to(BASE_DIR).as_posix()
+    except ValueError:
+        return full_path
+
+def _distance_arg():
+    d = request.args.get("distance", type=int)
+    return None if d is None else max(0, min(d, 64))
+
+@web.route("/api/duplicates")
+def api_duplicates():
+    """Near-duplicates of ?path= (relative to the upload folder), nearest first."""
+    rel = (request.args.get("path") or "").strip()
+    if not rel:
+        return jsonify({"error": "path is required"}), 400
+    full_path = (BASE_DIR / rel).resolve()
+    if not str(full_path).startswith(str(BASE_DIR)):
+        abort(403)
 
-        images.append({
-            "image_filename": r.get("image_filename"),
-            "relpath": str(rel).replace("\\", "/"),
-            "exif_datetime": r.get("exif_datetime"),
-            "exif_make": r.get("exif_make"),
-            "exif_model": r.get("exif_model"),
-            "exif_xpkeywords": r.get("exif_xpkeywords"),
-        })
-
-    return render_template("gallery.html", images=images, q=q, date=d,g = g)
+    matches = dups.near(str(full_path), _distance_arg())
+    if matches is None:
+        return jsonify({"error": "no perceptual hash stored for this file"}), 404
+    return jsonify({
+        "path": rel,
+        "matches": [{"path": _relpath(p), "distance": d} for d, p in matches],
+    })
+
+@web.route("/api/duplicates/clusters")
+def api_duplicate_clusters():
+    min_size = max(2, request.args.get("min_size", 2, type=int))
+    groups = dups.clusters(_distance_arg(), min_size)
+    return jsonify({
+        **dups.stats(),
+        "clusters": [[_relpath(p) for p in g] for g in groups],
+    })
+# ---------- STORED EXIF (exif.store) --------
+@web.route("/api/exif")
+def api_exif():
+    """Extra EXIF tags stored for ?path= (relative to the upload folder)."""
+    rel = (request.args.get("path") or "").strip()
+    if not rel:
+        return jsonify({"error": "path is required"}), 400
+    full_path = (BASE_DIR / rel).resolve()
+    if not str(full_path).startswith(str(BASE_DIR)):
+        abort(403)
+    data = db.get_exif(str(full_path))
+    if data is None:
+        return jsonify({"error": "no EXIF stored for this file"}), 404
+    return jsonify({"path": rel, "exif": data})
+
+def _scalar(value: str):
+    # stored EXIF numbers are JSON numbers; "16" has to compare as 16
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+@web.route("/api/exif/search")
+def api_exif_search():
+    """
+    Images by stored EXIF: lens, iso_min, iso_max, focal_min, focal_max,
+    f_max, orientation; any other ?TagName=value is matched exactly.
+    """
+    known = {"lens", "iso_min", "iso_max", "focal_min", "focal_max", "f_max", "orientation", "limit", "cursor"}
+    args = request.args
+    limit = max(1, min(args.get("limit", cfg.PAGE_SIZE, type=int), cfg.PAGE_SIZE_MAX))
+    try:
+        rows = db.search_exif(
+            lens_model=args.get("lens") or None,
+            iso_min=args.get("iso_min", type=int),
+            iso_max=args.get("iso_max", type=int),
+            focal_min=args.get("focal_min", type=float),
+            focal_max=args.get("focal_max", type=float),
+            f_number_max=args.get("f_max", type=float),
+            orientation=args.get("orientation", type=int),
+            fields={k: _scalar(v) for k, v in args.items() if k not in known},
+            limit=limit,
+            cursor=(args.get("cursor") or "").strip() or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "images": [
+            {**img.as_dict(), "exif_datetime": str(img.exif_datetime) if img.exif_datetime else None}
+            for img in to_gallery_items(rows)
+        ],
+        "next_cursor": next_cursor(rows, limit),
+    })
+# ---------- QUERY CACHE COUNTERS --------
+@web.route("/api/cache")
+def api_cache():
+    return jsonify(db.cache_stats())
+# ---------- PROMETHEUS METRICS --------
+@web.route("/metrics")
+def metrics_endpoint():
+    if not cfg.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 #--------- ROUTE FOR GALLERY IN THE WEBSITE ----------
 @web.route("/")
 def home():
@@ -75,20 +447,14 @@ def home():
 
 # ---------- API FOR UPDATING TAGS -----------
 def update_tag(file_path: str, tag_value: str):
-    tags = tag_value.split(",")
+    tags = split_tags(tag_value)
     try:
-        existing = db.get_tags(file_path)
-        print("EXISTING FROM DB:", repr(existing))
-
-        new_tags = tagm.merge_tags(existing, tags)
-        print("NEW_TAGS COMPUTED:", repr(new_tags))
-
-        rc = db.update_tag_info(file_path, new_tags)
-        print("ROWCOUNT:", rc)
-
-        # verify immediately (same run)
-        after = db.get_tags(file_path)
-        print("AFTER FROM DB:", repr(after))
+        # one pooled connection / transaction for read + write
+        with db.session():
+            # row lock: a concurrent edit waits instead of being overwritten
+            existing = db.get_tags_for_update([file_path]).get(file_path)
+            new_tags = tagm.merge_tags(existing, tags)
+            rc = db.update_tag_info(file_path, new_tags)
 
         return f"SUCCESS: tags='{new_tags}', rows_updated={rc}"
 
@@ -96,43 +462,137 @@ def update_tag(file_path: str, tag_value: str):
         return f"FAILED: {e}"
 # --------- API FOR DELETING TAGS --------
 def delete_tags(file_path: str, tag_value: str):
-    tags = tag_value.split(",")
+    tags = split_tags(tag_value)
     try:
-        existing = db.get_tags(file_path)
-        print("EXISTING FROM DB:", repr(existing))
-
-        new_tags = tagm.delete_tags(existing, tags)
-        print("NEW_TAGS COMPUTED:", repr(new_tags))
-
-        rc = db.update_tag_info(file_path, new_tags)
-        print("ROWCOUNT:", rc)
-
-        # verify immediately (same run)
-        after = db.get_tags(file_path)
-        print("AFTER FROM DB:", repr(after))
+        # one pooled connection / transaction for read + write
+        with db.session():
+            # row lock: a concurrent edit waits instead of being overwritten
+            existing = db.get_tags_for_update([file_path]).get(file_path)
+            new_tags = tagm.delete_tags(existing, tags)
+            rc = db.update_tag_info(file_path, new_tags)
 
         return f"SUCCESS: tags='{new_tags}', rows_updated={rc}"
 
     except Exception as e:
         return f"FAILED: {e}"
+# --------- API FOR BATCH TAG EDITS --------
+def batch_edit_tags(file_paths: list[str], add: list[str], remove: list[str]) -> list[dict]:
+    """
+    Add and/or remove tags on many files in one transaction.
+    Rows are locked (SELECT ... FOR UPDATE), the new strings are computed
+    with TagManager.merge_tags/delete_tags and written with one UPDATE.
+    Returns one result per input path, in input order.
+    """
+    with db.session():
+        current = db.get_tags_for_update(file_paths)
+        # MySQL matches paths case-insensitively; map back to what was asked
+        by_lower = {p.lower(): tags for p, tags in current.items()}
+
+        results = []
+        changed = {}
+        for path in file_paths:
+            if path in current:
+                existing = current[path]
+            elif path.lower() in by_lower:
+                existing = by_lower[path.lower()]
+            else:
+                results.append({"status": "not_found", "tags": None})
+                continue
+
+            new_tags = existing or ""
+            if add:
+                new_tags = tagm.merge_tags(new_tags, add)
+            if remove:
+                new_tags = tagm.delete_tags(new_tags, remove)
+
+            if new_tags != (existing or ""):
+                changed[path] = new_tags
+                results.append({"status": "updated", "tags": new_tags})
+            else:
+                results.append({"status": "unchanged", "tags": existing})
+
+        db.update_tags_many(changed)
+    return results
+
+@web.route("/api/tags/batch", methods=["POST"])
+def api_batch_tags():
+    """
+    JSON body:
+      {"files": ["relpath", ...], "add": ["sunrise", ...], "remove": [...]}
+    add/remove may also be comma separated strings.
+    """
+    body = request.get_json(silent=True) or {}
+    files = body.get("files") or []
+    if not isinstance(files, list) or not files:
+        return jsonify({"error": "files must be a non-empty list"}), 400
+    if len(files) > cfg.BATCH_TAG_LIMIT:
+        return jsonify({"error": f"at most {cfg.BATCH_TAG_LIMIT} files per request"}), 400
+
+    def tag_list(v):
+        return split_tags(v if isinstance(v, str) else ",".join(map(str, v or [])))
+
+    add = tag_list(body.get("add"))
+    remove = tag_list(body.get("remove"))
+    if not add and not remove:
+        return jsonify({"error": "nothing to add or remove"}), 400
+
+    results = [None] * len(files)
+    valid = {}   # full path -> index into files
+    for i, rel in enumerate(files):
+        full_path = (BASE_DIR / str(rel)).resolve()
+        if not str(full_path).startswith(str(BASE_DIR)):
+            results[i] = {"file": rel, "status": "forbidden", "tags": None}
+        else:
+            valid.setdefault(str(full_path), []).append(i)
+
+    try:
+        applied = batch_edit_tags(list(valid), add, remove)
+    except Exception as e:
+        return jsonify({"error": f"FAILED: {e}"}), 500
+
+    for full_path, res in zip(valid, applied):
+        for i in valid[full_path]:
+            results[i] = {"file": files[i], **res}
+
+    return jsonify({
+        "updated": sum(1 for r in applied if r["status"] == "updated"),
+        "results": results,
+    })
 # ---------- API FOR EDITING THE DATABSE INFO ---------
+_builder = None
+
+def ingest_builder():
+    """
+    The ExifDataFrameBuilder, created on first sync. Importing it pulls in
+    pandas and Pillow, which the gallery routes never need.
+    """
+    global _builder
+    if _builder is None:
+        from filereader import ExifDataFrameBuilder
+        _builder = ExifDataFrameBuilder(cfg)
+    return _builder
+
 def edit_database():
+    # only new/changed files (per the manifest) are opened and parsed,
+    # streamed in batches and upserted on full_path (one transaction each)
+    file_r = ingest_builder()
+    changes = file_r.scan_changes()
+    # moved/renamed files keep their row and tags: path update, no extraction
+    hashes = {}   # files hashed for move detection; extraction reuses them
+    changes.mark_moved(apply_moves(db, changes.new, changes.deleted, cfg.CONTENT_HASH_SAMPLE, hashes))
+    if changes.moved:
+        log.info("moved: %d", len(changes.moved))
 
-    data = db.get_full_path()
-    df = file_r.build_dataframe()
-    edited_data = {
-        Path(row[0]).resolve().as_posix().lower()
-        for row in data
-    }
-    for i in range(len(df["full_path"])):
-        df_path = Path(df["full_path"][i]).resolve().as_posix().lower()
+    counts = db.ingest(file_r.iter_batches(files=changes.to_extract, hashes=hashes))
+    log.info("synced: %s", counts)
 
-        if df_path not in edited_data:
-            db.new_insert_dataframe(df.iloc[[i]])
-            print("sucessful added the data")
-        else:
-            pass
-            print("not added data")
+    if changes.deleted:
+        log.info("removed deleted files: %s", db.delete_images(changes.deleted))
+
+    if cfg.THUMB_PREGENERATE:
+        log.info("thumbnails: %s", thumbs.pregenerate(changes.to_extract + list(changes.moved.values())))
+
+    file_r.manifest.save()
 
 # --------- FOR EDITING TAGS ROUTE ------------
 @web.route("/edit", methods=["POST"])
@@ -168,13 +628,17 @@ def edit_tags():
         exif_model = exif_model or None
 
         rc = db.update_metadata_info(str(full_path), exif_datetime, exif_make, exif_model)
-        print("UPDATED META ROWS:", rc)
+        log.info("updated meta rows: %s", rc)
 
         return redirect(url_for("gallery"))
 
     return "Invalid mode", 400
 # ------ to run the website --------
 if __name__ == "__main__":
+    # with the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves
+    if cfg.WATCH_WITH_WEB and (not cfg.DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        from watcher import start_in_background
+        start_in_background(cfg, db=db, builder=ingest_builder(), thumbs=thumbs)
     web.run(debug=cfg.DEBUG, host=cfg.HOST, port=cfg.PORT)
     #update_tag(r'C:\2 WEEK PROJECT\sample_images\TIJV0077.JPG',"sunrise,mountains,himalayas")
     #db.update_tag_info(